@@ -0,0 +1,352 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import torch
+import whisper
+from pytube import YouTube
+
+
+### Whisper transcription ###
+
+# sampling rate of the audio expected by Whisper
+SAMPLE_RATE = 16000
+
+# model loaded once per transcription process
+_model = None
+
+def init_transcriber(model_name="base", n_threads=None):
+    '''
+    Function to load the Whisper model once in the current process (used as initializer of the process pool).
+
+    Args:
+    model_name (str): Whisper model name
+    n_threads (int): number of CPU threads used by torch in this process, default is torch's choice
+    '''
+    global _model
+    if n_threads:
+        torch.set_num_threads(n_threads)
+    _model = whisper.load_model(model_name, device="cpu")
+
+
+def transcribe_file(path):
+    '''
+    Function to transcribe an audio file with the model loaded by init_transcriber.
+
+    Args:
+    path (str): path of the audio file
+
+    Returns:
+    text (str): transcribed text, audio duration in seconds and transcription time in seconds
+    '''
+    if _model is None:
+        init_transcriber()
+    start_time = time.time()
+    audio = whisper.load_audio(path)
+    result = _model.transcribe(audio, fp16=False)
+    return result["text"], len(audio) / SAMPLE_RATE, time.time() - start_time
+
+
+# download errors meaning that the audio can not be retrieved: stored, so the video is not tried again
+# (other errors, e.g. network or HTTP 5xx errors, are transient: not stored, the next run tries again)
+PERMANENT_DOWNLOAD_ERRORS = {"VideoTooLong", "VideoUnavailable", "VideoPrivate", "MembersOnly", "AgeRestrictedError",
+                             "LiveStreamError", "RecordingUnavailable", "VideoRegionBlocked"}
+
+class VideoTooLong(ValueError):
+    pass
+
+
+def download_audio(video_id, output_path="YoutubeAudios", max_length=600):
+    '''
+    Function to download the audio stream of a YouTube video.
+
+    Args:
+    video_id (str): YouTube video ID
+    output_path (str): folder where the audio file is saved
+    max_length (int): maximum video length in seconds, longer videos raise VideoTooLong (None for no limit)
+
+    Returns:
+    path (str): path of the downloaded audio file
+    '''
+    # Create a YouTube object from the URL
+    yt = YouTube("https://www.youtube.com/watch?v=" + video_id)
+
+    # Check if the video is too long
+    if max_length is not None and yt.length > max_length:
+        raise VideoTooLong("Video too long")
+
+    # Download the audio stream
+    audio_stream = yt.streams.filter(only_audio=True).first()
+    filename = "audio_"+video_id+".mp3"
+    audio_stream.download(output_path=output_path, filename=filename)
+
+    return os.path.join(output_path, filename)
+
+
+### Audio pre-processing ###
+
+def speech_segments(audio, frame_length=0.03, threshold_db=-35, min_silence=0.5, padding=0.2):
+    '''
+    Function to find the non-silent parts of an audio signal, based on the energy of short frames.
+
+    Args:
+    audio (np.ndarray): mono audio at 16 kHz
+    frame_length (float): frame length in seconds
+    threshold_db (float): frames quieter than the loudest frame by more than this many dB are silent
+    min_silence (float): silences shorter than this (in seconds) are kept
+    padding (float): seconds kept before and after each non-silent part
+
+    Returns:
+    segments (list): list of (start, end) sample indices
+    '''
+    frame = int(frame_length * SAMPLE_RATE)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return [(0, len(audio))] if len(audio) > 0 else []
+
+    frames = np.asarray(audio[:n_frames * frame], dtype=np.float32).reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    # digital silence
+    if rms.max() < 1e-4:
+        return []
+    voiced = 20 * np.log10(rms / rms.max() + 1e-10) > threshold_db
+
+    # start and end frame of each run of voiced frames
+    changes = np.flatnonzero(np.diff(np.concatenate([[0], voiced.astype(np.int8), [0]])))
+    starts, ends = changes[::2], changes[1::2]
+
+    # pad runs and merge those separated by short silences
+    max_gap = int(min_silence / frame_length)
+    pad = int(padding / frame_length)
+    segments = []
+    for start, end in zip(starts, ends):
+        start, end = max(0, start - pad), min(n_frames, end + pad)
+        if segments and start - segments[-1][1] <= max_gap:
+            segments[-1][1] = max(segments[-1][1], end)
+        else:
+            segments.append([start, end])
+
+    return [(start * frame, len(audio) if end == n_frames else end * frame) for start, end in segments]
+
+
+def make_chunks(segments, chunk_length=300):
+    '''
+    Function to group consecutive segments into chunks of at most chunk_length seconds of audio, cutting between
+    segments (segments longer than a chunk are split).
+
+    Args:
+    segments (list): list of (start, end) sample indices
+    chunk_length (float): maximum chunk length in seconds
+
+    Returns:
+    chunks (list): list of lists of (start, end) sample indices
+    '''
+    max_samples = int(chunk_length * SAMPLE_RATE)
+    chunks = []
+    current = []
+    size = 0
+    for start, end in segments:
+        if current and size + (end - start) > max_samples:
+            chunks.append(current)
+            current = []
+            size = 0
+        while end - start > max_samples:
+            chunks.append([(start, start + max_samples)])
+            start += max_samples
+        current.append((start, end))
+        size += end - start
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def prepare_audio(path, trim_silence=True, chunk_length=300):
+    '''
+    Function to decode an audio file once to 16 kHz mono, save it as a .npy file (read back memory-mapped by the
+    transcription processes) and split it into chunks of non-silent audio. The original file is deleted.
+
+    Args:
+    path (str): path of the audio file
+    trim_silence (bool): if True, silent parts are removed
+    chunk_length (float): maximum chunk length in seconds
+
+    Returns:
+    npy_path (str): path of the decoded audio, audio duration in seconds and list of chunks
+    '''
+    audio = whisper.load_audio(path)
+    npy_path = os.path.splitext(path)[0] + ".npy"
+    np.save(npy_path, audio)
+    os.remove(path)
+
+    segments = speech_segments(audio) if trim_silence else [(0, len(audio))]
+    return npy_path, len(audio) / SAMPLE_RATE, make_chunks(segments, chunk_length)
+
+
+def transcribe_segments(npy_path, segments):
+    '''
+    Function to transcribe some segments of a decoded audio file with the model loaded by init_transcriber.
+
+    Args:
+    npy_path (str): path of the audio saved by prepare_audio
+    segments (list): list of (start, end) sample indices, concatenated before transcription
+
+    Returns:
+    text (str): transcribed text, duration of the transcribed audio in seconds and transcription time in seconds
+    '''
+    if _model is None:
+        init_transcriber()
+    start_time = time.time()
+    audio = np.load(npy_path, mmap_mode="r")
+    chunk = np.concatenate([audio[start:end] for start, end in segments])
+    result = _model.transcribe(chunk, fp16=False)
+    return result["text"], len(chunk) / SAMPLE_RATE, time.time() - start_time
+
+
+def fetch_audio(video_id, output_path="YoutubeAudios", max_length=600, preprocess=False, chunk_length=300):
+    '''
+    Function to download the audio of a video and define the transcription jobs.
+
+    Args:
+    video_id (str): YouTube video ID
+    output_path (str): folder where the audio file is saved
+    max_length (int): maximum video length in seconds (None for no limit)
+    preprocess (bool): if True, decode the audio, trim silences and split it into chunks (see prepare_audio)
+    chunk_length (float): maximum chunk length in seconds, with preprocess
+
+    Returns:
+    path (str): path of the audio to delete at the end, audio duration in seconds (None if unknown)
+    and list of (function, arguments) transcription jobs
+    '''
+    path = download_audio(video_id, output_path, max_length)
+    if not preprocess:
+        return path, None, [(transcribe_file, (path,))]
+    npy_path, duration, chunks = prepare_audio(path, chunk_length=chunk_length)
+    return npy_path, duration, [(transcribe_segments, (npy_path, chunk)) for chunk in chunks]
+
+
+### Transcription pipeline ###
+
+def transcribe_videos(video_ids, store, model_name="base", n_download_workers=4, n_transcribe_workers=1, output_path="YoutubeAudios", max_length=600, preprocess=False, chunk_length=300):
+    '''
+    Function to transcribe YouTube videos with Whisper on CPU. Audio downloads (thread pool) overlap with the
+    transcriptions (process pool, the model is loaded once per process). Results are cached in the store, and
+    audio files are deleted once transcribed.
+
+    With preprocess, the audio is decoded once to 16 kHz mono, silences are removed, and long videos are split into
+    chunks transcribed in parallel and stitched back together.
+
+    Args:
+    video_ids (list): list of YouTube video IDs
+    store (TranscriptStore): store of Whisper transcripts, videos already in the store are not transcribed again
+    (videos whose download failed with a transient error are not stored)
+    model_name (str): Whisper model name
+    n_download_workers (int): number of download threads
+    n_transcribe_workers (int): number of transcription processes, the CPU cores are split between them
+    output_path (str): folder for the temporary audio files
+    max_length (int): maximum video length in seconds (None for no limit)
+    preprocess (bool): if True, trim silences and split long videos into chunks
+    chunk_length (float): maximum chunk length in seconds, with preprocess
+
+    Returns:
+    stats (dict): number of transcribed and failed videos, audio duration, real-time factor
+    (transcription time / audio duration) and throughput in videos per minute
+    '''
+    todo = [video_id for video_id in dict.fromkeys(video_ids) if video_id not in store]
+    n_threads = max(1, (os.cpu_count() or 1) // n_transcribe_workers)
+    # downloaded files waiting for transcription are bounded, so that downloads do not fill the disk
+    max_in_flight = n_download_workers + 2 * n_transcribe_workers
+
+    n_done = 0
+    n_failed = 0
+    audio_duration = 0.0
+    transcribe_time = 0.0
+    start_time = time.time()
+
+    # workers are spawned, not forked: they start while download threads are running, and reload the model anyway
+    context = multiprocessing.get_context("spawn")
+    with ThreadPoolExecutor(max_workers=n_download_workers) as downloader, \
+            ProcessPoolExecutor(max_workers=n_transcribe_workers, mp_context=context, initializer=init_transcriber,
+                                initargs=(model_name, n_threads)) as transcriber:
+
+        downloads = {}
+        transcriptions = {}
+        # videos being transcribed: chunk texts, chunks left, audio path and duration
+        videos = {}
+        next_index = 0
+
+        while next_index < len(todo) or downloads or transcriptions:
+
+            # start new downloads while there is room
+            while next_index < len(todo) and len(downloads) + len(videos) < max_in_flight:
+                video_id = todo[next_index]
+                downloads[downloader.submit(fetch_audio, video_id, output_path, max_length, preprocess, chunk_length)] = video_id
+                next_index += 1
+
+            done, _ = wait(list(downloads) + list(transcriptions), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future in downloads:
+                    video_id = downloads.pop(future)
+                    try:
+                        path, duration, jobs = future.result()
+                    except Exception as e:
+                        print("Error in audio download for", video_id, repr(e))
+                        if type(e).__name__ in PERMANENT_DOWNLOAD_ERRORS:
+                            store.add(video_id, None, error=type(e).__name__)
+                        n_failed += 1
+                        continue
+                    if not jobs:
+                        print("No speech in video", video_id)
+                        store.add(video_id, None, error="NoSpeech")
+                        os.remove(path)
+                        n_failed += 1
+                        continue
+                    videos[video_id] = {"texts": [None] * len(jobs), "left": len(jobs), "path": path, "duration": duration, "processed": 0.0, "error": None}
+                    for i, (function, args) in enumerate(jobs):
+                        transcriptions[transcriber.submit(function, *args)] = (video_id, i)
+                    continue
+
+                video_id, i = transcriptions.pop(future)
+                video = videos[video_id]
+                try:
+                    text, duration, elapsed = future.result()
+                    video["texts"][i] = text.strip()
+                    video["processed"] += duration
+                    transcribe_time += elapsed
+                except Exception as e:
+                    print("Error in transcription for", video_id, repr(e))
+                    video["error"] = type(e).__name__
+                video["left"] -= 1
+                if video["left"] > 0:
+                    continue
+
+                # all chunks transcribed: stitch them together
+                del videos[video_id]
+                if video["error"] is None:
+                    store.add(video_id, " ".join(video["texts"]))
+                    audio_duration += video["duration"] if video["duration"] is not None else video["processed"]
+                    n_done += 1
+                else:
+                    store.add(video_id, None, error=video["error"])
+                    n_failed += 1
+                # delete processed audio
+                if os.path.exists(video["path"]):
+                    os.remove(video["path"])
+
+                if n_done % 10 == 0 and n_done > 0:
+                    print("Counter:", n_done, "/", len(todo))
+
+    elapsed = time.time() - start_time
+    stats = {
+        "n_videos": n_done,
+        "n_failed": n_failed,
+        "audio_duration": audio_duration,
+        "real_time_factor": transcribe_time / audio_duration if audio_duration > 0 else 0.0,
+        "videos_per_minute": 60 * n_done / elapsed if elapsed > 0 else 0.0,
+    }
+    if todo:
+        print("Transcribed %d videos (%d failed), %.0f seconds of audio in %.1f seconds: real-time factor %.2f, %.1f videos/min" % (
+            n_done, n_failed, audio_duration, elapsed, stats["real_time_factor"], stats["videos_per_minute"]))
+
+    return stats
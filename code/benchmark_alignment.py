@@ -0,0 +1,56 @@
+# import required modules
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from cleaning_utils import CommentIndex
+from embedding_utils import EmbeddingStore, centroid_alignment
+
+#### Benchmark parameters ####
+n_comments = 200000
+n_videos = 5000
+dim = 384 # dimension of all-MiniLM-L6-v2 embeddings
+seed = 42
+
+#### Synthetic embeddings ####
+
+rng = np.random.default_rng(seed)
+video_ids = ["video_%d" % i for i in range(n_videos)]
+data_videos = pd.DataFrame({"Video ID": video_ids})
+embeddings_videos = rng.standard_normal((n_videos, dim)).astype(np.float32)
+# comments as in extract_video_comments_metrics.py, some videos without comments
+yt_comments = [("comment %d" % j, video_ids[i]) for j, i in enumerate(rng.integers(0, n_videos - 100, n_comments))]
+comment_index = CommentIndex([item[1] for item in yt_comments])
+
+with tempfile.TemporaryDirectory() as path:
+    store = EmbeddingStore(path)
+    store.add([item[0] for item in yt_comments], rng.standard_normal((n_comments, dim)).astype(np.float32))
+
+    #### Loop vs batched alignment ####
+
+    # previous behaviour: one centroid and one cosine per video
+    start_time = time.time()
+    loop = []
+    for i, video in data_videos.iterrows():
+        emb_video = embeddings_videos[i]
+        indices = comment_index.indices(video["Video ID"])
+        if len(indices) == 0:
+            continue
+        emb_comments = store.get_many([yt_comments[j][0] for j in indices])
+        centroid_comments = np.mean(emb_comments, axis=0)
+        loop.append(np.dot(emb_video, centroid_comments)/(np.linalg.norm(emb_video)*np.linalg.norm(centroid_comments)))
+    time_loop = time.time() - start_time
+
+    # all videos at once, including the retrieval of the comments sorted by video
+    start_time = time.time()
+    counts = comment_index.counts(video_ids)
+    emb_comments = store.get_many([yt_comments[j][0] for j in comment_index.indices_many(video_ids)])
+    time_retrieval = time.time() - start_time
+    cosine = centroid_alignment(embeddings_videos, emb_comments, counts)
+    time_batch = time.time() - start_time
+
+# both methods should give the same alignment
+assert np.allclose(loop, cosine[counts > 0], atol=1e-5)
+print("%d videos, %d comments" % (n_videos, n_comments))
+print("loop:    %.2f seconds" % time_loop)
+print("batched: %.2f seconds (%.2f retrieving embeddings, %.3f alignment), %.1fx" % (time_batch, time_retrieval, time_batch - time_retrieval, time_loop / time_batch))
@@ -0,0 +1,45 @@
+# import required modules
+import os
+import tempfile
+import time
+from mock_youtube import MockYouTubeService
+from utils import ResponseCache, CachedService, search_videos, get_videos_details, get_video_comments
+
+#### Benchmark parameters ####
+n_videos = 200
+latency = 0.05 # simulated round-trip time in seconds
+
+#### Collection run without cache, with a cold cache, with a warm cache and in replay-only mode ####
+
+def collect(youtube):
+    # search, details and comments, as in get_yt_videos.py and get_yt_comments.py
+    search_results = search_videos(youtube, threshold_api_units=8000, n_nextpage=10, q="veganuary", type="video", part="id", maxResults=50)
+    video_ids = [video['id']['videoId'] for video in search_results]
+    details, _ = get_videos_details(youtube, video_ids)
+    comments = {}
+    for video_id in video_ids:
+        comments[video_id] = get_video_comments(youtube, video_id)
+    return details, comments
+
+mock = MockYouTubeService(n_videos=n_videos, latency=latency)
+cache_path = os.path.join(tempfile.mkdtemp(), "api_cache.sqlite")
+
+runs = [
+    ("no cache", lambda: mock),
+    ("cold cache", lambda: CachedService(mock, ResponseCache(cache_path))),
+    ("warm cache", lambda: CachedService(mock, ResponseCache(cache_path))),
+    ("replay only", lambda: CachedService(None, ResponseCache(cache_path, replay_only=True))),
+]
+
+reference = None
+for name, make_service in runs:
+    youtube = make_service()
+    mock.reset_counters()
+    start_time = time.time()
+    results = collect(youtube)
+    elapsed = time.time() - start_time
+    if reference is None:
+        reference = results
+    # cached responses should give the same data
+    assert results == reference
+    print("%-12s %.2f seconds, %d API requests, %d units" % (name, elapsed, mock.n_requests, mock.quota_used))
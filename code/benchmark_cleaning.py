@@ -0,0 +1,50 @@
+# import required modules
+import time
+import random
+from utils import clean_text, clean_comments, clean_text_batch, clean_comments_batch
+
+#### Benchmark parameters ####
+n_comments = 1000000
+n_transcripts = 10000
+seed = 42
+
+#### Synthetic corpus ####
+
+rng = random.Random(seed)
+vocabulary = ["vegan", "meat", "plant", "based", "food", "I", "we", "love", "the", "a", "to", "is", "and", "2023", "100",
+              "Veganuary", "challenge", "don't", "it's", "great!", "recipe,", "tofu...", "día", "café", "_", "..."]
+extras = ["http://youtu.be/abc", "https://example.com/x?y=1", "@user", "@", "a@http://x.com", "[Music]", "[Applause]", "#vegan", "😀", "\n"]
+
+def make_text(n_words):
+    words = [rng.choice(extras) if rng.random() < 0.05 else rng.choice(vocabulary) for _ in range(n_words)]
+    return " ".join(words)
+
+comments = [make_text(rng.randint(1, 30)) if rng.random() > 0.01 else None for _ in range(n_comments)]
+transcripts = [make_text(rng.randint(5, 2000)).replace(" ", ". ", rng.randint(0, 50)) for _ in range(n_transcripts)]
+STOPWORDS = ["the", "a", "to", "is", "and", "i", "we"]
+
+#### Benchmark ####
+
+def report(name, n, time_single, time_batch):
+    print("%-24s %8.0f texts/s -> %8.0f texts/s (%.1fx)" % (name, n / time_single, n / time_batch, time_single / time_batch))
+
+# comments
+start_time = time.time()
+single = [clean_comments(text) for text in comments]
+time_single = time.time() - start_time
+start_time = time.time()
+batch = clean_comments_batch(comments)
+time_batch = time.time() - start_time
+assert single == batch
+report("clean_comments", n_comments, time_single, time_batch)
+
+# transcripts, with and without stopwords (clean_text is not defined for missing texts)
+for topic_model in (False, True):
+    start_time = time.time()
+    single = [clean_text(text, STOPWORDS, topic_model=topic_model) for text in transcripts]
+    time_single = time.time() - start_time
+    start_time = time.time()
+    batch = clean_text_batch(transcripts, STOPWORDS, topic_model=topic_model)
+    time_batch = time.time() - start_time
+    assert single == batch
+    report("clean_text (topic_model)" if topic_model else "clean_text", n_transcripts, time_single, time_batch)
@@ -0,0 +1,33 @@
+# import required modules
+import time
+import random
+from cleaning_utils import CommentIndex
+
+#### Benchmark parameters ####
+corpus_sizes = [5000, 10000, 20000, 40000] # number of comments
+comments_per_video = 20
+seed = 42
+
+#### Scan vs index, growing corpus ####
+
+rng = random.Random(seed)
+print("%10s %10s %14s %14s" % ("comments", "videos", "scan (s)", "index (s)"))
+for n_comments in corpus_sizes:
+    n_videos = n_comments // comments_per_video
+    video_ids = ["video_%d" % i for i in range(n_videos)]
+    yt_comments = [("comment %d" % j, rng.choice(video_ids)) for j in range(n_comments)]
+
+    # previous behaviour: one scan of all comments per video
+    start_time = time.time()
+    scan = [[j for j in range(len(yt_comments)) if yt_comments[j][1] == video_id] for video_id in video_ids]
+    time_scan = time.time() - start_time
+
+    # index built once, including the construction time
+    start_time = time.time()
+    comment_index = CommentIndex([item[1] for item in yt_comments])
+    index = [comment_index.indices(video_id).tolist() for video_id in video_ids]
+    time_index = time.time() - start_time
+
+    # both methods should find the same comments, in the same order
+    assert scan == index
+    print("%10d %10d %14.3f %14.4f" % (n_comments, n_videos, time_scan, time_index))
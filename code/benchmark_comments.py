@@ -0,0 +1,41 @@
+# import required modules
+import time
+from mock_youtube import MockYouTubeService
+from utils import get_video_comments, harvest_comments, RateLimiter
+
+#### Benchmark parameters ####
+n_videos = 200
+latency = 0.05 # simulated round-trip time in seconds
+error_rate = 0.02 # probability of a transient error per request
+n_workers = 16
+
+#### Sequential vs parallel comment retrieval ####
+
+youtube = MockYouTubeService(n_videos=n_videos, latency=latency, error_rate=error_rate)
+video_ids = youtube.video_ids
+
+# one video at a time
+results_sequential = {}
+failed_sequential = 0
+start_time = time.time()
+for video_id in video_ids:
+    try:
+        results_sequential[video_id] = get_video_comments(youtube, video_id, backoff=0.1)
+    except Exception:
+        failed_sequential += 1
+time_sequential = time.time() - start_time
+
+youtube.reset_counters()
+
+# thread pool, the mock is shared by all threads
+results_parallel = {}
+limiter = RateLimiter(requests_per_second=1000, daily_quota=100000)
+stats = harvest_comments(video_ids, lambda: youtube, n_workers=n_workers, limiter=limiter, backoff=0.1, on_result=lambda video_id, comments: results_parallel.update({video_id: comments}))
+
+# both methods should retrieve the same comments
+assert all(results_parallel[video_id] == results_sequential[video_id] for video_id in results_parallel if video_id in results_sequential)
+
+print("Videos: %d" % n_videos)
+print("Sequential: %.2f seconds, %.1f videos/min, %d failed" % (time_sequential, 60 * len(results_sequential) / time_sequential, failed_sequential))
+print("Parallel (%d threads): %.2f seconds, %.1f videos/min, %d failed" % (n_workers, stats["elapsed"], stats["videos_per_minute"], stats["n_failed"]))
+print("API units used by the parallel run: %d" % limiter.units_used)
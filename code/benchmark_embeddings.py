@@ -0,0 +1,55 @@
+# import required modules
+import os
+import time
+import random
+import numpy as np
+from embedding_utils import encode, EncoderPool
+
+#### Benchmark parameters ####
+n_sentences = 20000
+n_workers = [2, 4, 8] # number of processes of the encoding pool
+seed = 42
+
+#### Synthetic corpus ####
+
+rng = random.Random(seed)
+vocabulary = ["vegan", "meat", "plant", "based", "food", "i", "we", "love", "the", "a", "to", "is", "and", "veganuary",
+              "challenge", "recipe", "tofu", "cheese", "milk", "protein", "animals", "climate", "healthy", "month", "try"]
+sentences = [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(3, 60))) for _ in range(n_sentences)]
+
+#### Benchmark ####
+
+def cosine_drift(embeddings, reference):
+    # cosine similarity of each embedding with the float32 embedding of the same sentence
+    norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1)
+    return np.sum(embeddings * reference, axis=1) / norms
+
+
+if __name__ == "__main__":
+    print("%d sentences, %d CPU cores" % (n_sentences, os.cpu_count()))
+    print("%-24s %14s %16s %16s" % ("backend", "sentences/s", "mean cosine", "min cosine"))
+
+    def report(name, elapsed, embeddings, reference):
+        cosine = cosine_drift(embeddings, reference)
+        print("%-24s %14.1f %16.6f %16.6f" % (name, n_sentences / elapsed, cosine.mean(), cosine.min()), flush=True)
+
+    # reference: float32 model, one process using all cores
+    encode(sentences[:100], device="cpu", show_progress_bar=False)
+    start_time = time.time()
+    reference = encode(sentences, device="cpu", show_progress_bar=False)
+    report("float32", time.time() - start_time, reference, reference)
+
+    # int8 model, one process using all cores
+    encode(sentences[:100], show_progress_bar=False, quantize=True)
+    start_time = time.time()
+    embeddings = encode(sentences, show_progress_bar=False, quantize=True)
+    report("int8", time.time() - start_time, embeddings, reference)
+
+    # pools of processes, models loaded before timing
+    for quantize in (False, True):
+        for n in n_workers:
+            with EncoderPool(n, quantize=quantize) as pool:
+                pool(sentences[:pool.part_size * pool.n_workers])
+                start_time = time.time()
+                embeddings = pool(sentences)
+                report("%s, %d processes" % ("int8" if quantize else "float32", pool.n_workers), time.time() - start_time, embeddings, reference)
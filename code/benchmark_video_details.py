@@ -0,0 +1,37 @@
+# import required modules
+import time
+from mock_youtube import MockYouTubeService
+from utils import get_video_details, get_videos_details
+
+#### Benchmark parameters ####
+n_videos = 500
+latency = 0.05 # simulated round-trip time in seconds
+missing_rate = 0.02
+
+#### Per-video vs batched videos().list ####
+
+youtube = MockYouTubeService(n_videos=n_videos, latency=latency, missing_rate=missing_rate)
+video_ids = youtube.video_ids
+
+# one request per video
+start_time = time.time()
+details_single = [get_video_details(youtube, video_id) for video_id in video_ids]
+time_single = time.time() - start_time
+requests_single, quota_single = youtube.n_requests, youtube.quota_used
+
+youtube.reset_counters()
+
+# one request per 50 videos
+start_time = time.time()
+details_batch, missing_ids = get_videos_details(youtube, video_ids)
+time_batch = time.time() - start_time
+requests_batch, quota_batch = youtube.n_requests, youtube.quota_used
+
+# both methods should return the same details
+assert details_single == details_batch
+assert set(missing_ids) == youtube.missing_ids
+
+print("Videos: %d (missing: %d)" % (n_videos, len(missing_ids)))
+print("Per-video: %d requests, %d units, %.2f seconds" % (requests_single, quota_single, time_single))
+print("Batched:   %d requests, %d units, %.2f seconds" % (requests_batch, quota_batch, time_batch))
+print("Speedup: %.1fx" % (time_single / time_batch))
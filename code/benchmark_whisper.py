@@ -0,0 +1,113 @@
+# import required modules
+import os
+import math
+import random
+import struct
+import time
+import wave
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import whisper
+from audio_utils import init_transcriber, transcribe_file, transcribe_segments, speech_segments, make_chunks, SAMPLE_RATE
+
+#### Benchmark parameters ####
+fixtures_path = "./audio_fixtures"
+model_name = "base"
+n_fixtures = 4 # number of synthetic fixtures generated if the folder is empty
+fixture_length = 30 # length of the synthetic fixtures in seconds
+n_workers = 2
+chunk_length = 10 # chunk length in seconds with pre-processing (short, as the fixtures are short)
+
+#### Functions definition ####
+
+def make_fixture(path, length, seed):
+    '''
+    Function to write a synthetic mono 16 kHz WAV file: tone bursts with noise, separated by silence.
+
+    Args:
+    path (str): output path
+    length (int): length in seconds
+    seed (int): random seed
+    '''
+    rng = random.Random(seed)
+    samples = []
+    for i in range(length * SAMPLE_RATE):
+        t = i / SAMPLE_RATE
+        # one second of sound every two seconds
+        if int(t) % 2 == 0:
+            value = 0.3 * math.sin(2 * math.pi * (200 + 50 * int(t)) * t) + 0.05 * rng.uniform(-1, 1)
+        else:
+            value = 0.0
+        samples.append(int(value * 32767))
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(struct.pack("<%dh" % len(samples), *samples))
+
+
+def transcribe_reload(path):
+    # previous behaviour of yt_audio_to_text.py: the model is loaded for every video
+    start_time = time.time()
+    model = whisper.load_model(model_name, device="cpu")
+    audio = whisper.load_audio(path)
+    result = model.transcribe(audio, fp16=False)
+    return result["text"], len(audio) / SAMPLE_RATE, time.time() - start_time
+
+
+#### Benchmark ####
+
+if __name__ == "__main__":
+
+    # use the audio files in fixtures_path, or generate synthetic ones
+    if not os.path.exists(fixtures_path):
+        os.makedirs(fixtures_path)
+    files = sorted(os.path.join(fixtures_path, f) for f in os.listdir(fixtures_path) if f.endswith((".mp3", ".wav", ".m4a")))
+    if not files:
+        for i in range(n_fixtures):
+            files.append(os.path.join(fixtures_path, "fixture_%d.wav" % i))
+            make_fixture(files[-1], fixture_length, seed=i)
+
+    audio_duration = sum(len(whisper.load_audio(f)) / SAMPLE_RATE for f in files)
+    print("Fixtures: %d files, %.0f seconds of audio" % (len(files), audio_duration))
+
+    def report(name, elapsed):
+        print("%-28s %.1f seconds, real-time factor %.2f, %.1f files/min" % (name, elapsed, elapsed / audio_duration, 60 * len(files) / elapsed))
+
+    # model loaded for every file
+    start_time = time.time()
+    for f in files:
+        transcribe_reload(f)
+    report("reload per file", time.time() - start_time)
+
+    # model loaded once
+    start_time = time.time()
+    init_transcriber(model_name)
+    for f in files:
+        transcribe_file(f)
+    report("load once", time.time() - start_time)
+
+    # model loaded once per process, cores split between processes
+    start_time = time.time()
+    n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_transcriber, initargs=(model_name, n_threads)) as executor:
+        list(executor.map(transcribe_file, files))
+    report("load once, %d processes" % n_workers, time.time() - start_time)
+
+    # pre-processing: audio decoded once, silences trimmed, chunks transcribed in parallel
+    start_time = time.time()
+    jobs = []
+    speech_duration = 0.0
+    for f in files:
+        audio = whisper.load_audio(f)
+        npy_path = os.path.splitext(f)[0] + ".npy"
+        np.save(npy_path, audio)
+        segments = speech_segments(audio)
+        speech_duration += sum(end - start for start, end in segments) / SAMPLE_RATE
+        jobs += [(npy_path, chunk) for chunk in make_chunks(segments, chunk_length)]
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_transcriber, initargs=(model_name, n_threads)) as executor:
+        list(executor.map(transcribe_segments, *zip(*jobs)))
+    report("pre-processed, %d processes" % n_workers, time.time() - start_time)
+    print("Speech kept after trimming: %.0f%% of the audio, %d chunks" % (100 * speech_duration / audio_duration, len(jobs)))
+    for f in files:
+        os.remove(os.path.splitext(f)[0] + ".npy")
@@ -0,0 +1,208 @@
+import os
+import json
+import math
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from utils import API_UNIT_COSTS
+
+
+### Search campaign planning ###
+
+def make_task(tag, keyword, year, start_date, end_date, baseline=False, priority=1.0, max_pages=11):
+    '''
+    Function to define a search task: one keyword of one tag (i.e. challenge) in one time window.
+
+    Args:
+    tag (str): challenge of interest
+    keyword (str): search keyword (for baseline tasks, only used in the output file name)
+    year (int): year of the time window
+    start_date (str): publishedAfter parameter of the search, e.g. "2019-12-01T00:00:00Z"
+    end_date (str): publishedBefore parameter of the search
+    baseline (bool): if True, search baseline videos instead of videos matching the keyword
+    priority (float): relative importance of the task, tasks with higher priority get quota first
+    max_pages (int): maximum number of search pages to retrieve
+
+    Returns:
+    task (dict): task definition and progress
+    '''
+    return {
+        "id": "|".join([tag, keyword, str(year), "baseline" if baseline else "target"]),
+        "tag": tag,
+        "keyword": keyword,
+        "year": year,
+        "start_date": start_date,
+        "end_date": end_date,
+        "baseline": baseline,
+        "priority": priority,
+        "max_pages": max_pages,
+        # progress
+        "pages_done": 0,
+        "next_page_token": "",
+        "done": False,
+        "units_used": 0,
+        "n_results": 0,
+        "n_new": 0,
+        "last_new": None,
+        "video_ids": [],
+    }
+
+
+def quota_day():
+    '''
+    Returns the current quota day. The YouTube API quota resets at midnight Pacific Time.
+    '''
+    return datetime.now(ZoneInfo("America/Los_Angeles")).strftime("%Y-%m-%d")
+
+
+class CampaignScheduler:
+    '''
+    Scheduler of search campaigns over tags x keywords x years, spreading the daily API quota across tasks.
+
+    The campaign runs one search page at a time. The next page is taken from the task with the highest expected
+    number of new videos per API unit (weighted by the task priority). Every task gets its first page before any task
+    gets a second one, then deeper pages go to the tasks that keep returning the most new videos.
+    Progress and daily usage are saved after every page, so the campaign resumes the next day where it stopped.
+
+    Args:
+    state_path (str): path of the JSON file storing the campaign progress
+    daily_quota (int): API units available per day
+    reserve (int): API units per day left for other scripts (e.g. get_yt_comments.py)
+    results_per_page (int): number of results requested per search page (maxResults)
+    '''
+
+    def __init__(self, state_path, daily_quota=10000, reserve=0, results_per_page=50):
+        self.state_path = state_path
+        self.daily_quota = daily_quota
+        self.reserve = reserve
+        self.results_per_page = results_per_page
+
+        if os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                self.state = json.load(f)
+        else:
+            self.state = {"tasks": {}, "usage": {}}
+
+    def save(self):
+        # write to a temporary file first, so that a crash never leaves a corrupted state
+        folder = os.path.dirname(self.state_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(self.state_path + ".tmp", "w") as f:
+            json.dump(self.state, f)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def add_tasks(self, tasks):
+        '''
+        Adds tasks to the campaign, tasks already in the campaign keep their progress (their priority is updated).
+        '''
+        for task in tasks:
+            if task["id"] in self.state["tasks"]:
+                self.state["tasks"][task["id"]]["priority"] = task["priority"]
+            else:
+                self.state["tasks"][task["id"]] = task
+        self.save()
+
+    def tasks(self):
+        return list(self.state["tasks"].values())
+
+    def expected_new(self, task):
+        '''
+        Returns the expected number of new videos in the next page of a task: the new videos of its last page,
+        or, for tasks not started yet, the average share of new videos observed so far in the tag.
+        '''
+        if task["last_new"] is not None:
+            return task["last_new"]
+        started = [t for t in self.tasks() if t["tag"] == task["tag"] and t["n_results"] > 0]
+        n_results = sum(t["n_results"] for t in started)
+        new_rate = sum(t["n_new"] for t in started) / n_results if n_results > 0 else 1.0
+        return new_rate * self.results_per_page
+
+    def page_cost(self, task, n_new=None):
+        '''
+        Returns the estimated API units of the next page of a task: one search call and the details of the new videos.
+        '''
+        if n_new is None:
+            n_new = self.expected_new(task)
+        return API_UNIT_COSTS["search"] + math.ceil(n_new / 50) * API_UNIT_COSTS["videos"]
+
+    def score(self, task):
+        return task["priority"] * self.expected_new(task) / self.page_cost(task)
+
+    def next_task(self):
+        '''
+        Returns the task whose next page has the highest expected new videos per API unit, or None if the campaign is complete.
+        '''
+        pending = [t for t in self.tasks() if not t["done"]]
+        if not pending:
+            return None
+        # tasks not started yet come first, so that no year or keyword is starved
+        return min(pending, key=lambda t: (t["pages_done"] > 0, -self.score(t)))
+
+    def units_used_today(self):
+        return self.state["usage"].get(quota_day(), 0)
+
+    def remaining_today(self):
+        '''
+        Returns the API units the campaign can still use today.
+        '''
+        return max(0, self.daily_quota - self.reserve - self.units_used_today())
+
+    def record_page(self, task, next_page_token, video_ids, n_new, units_used):
+        '''
+        Records the result of one search page and saves the campaign progress.
+
+        Args:
+        task (dict): task returned by next_task
+        next_page_token (str): token of the next page, None if this was the last page
+        video_ids (list): ids of the videos returned by the page
+        n_new (int): number of videos not retrieved before by any task
+        units_used (int): API units actually used
+        '''
+        task["pages_done"] += 1
+        task["next_page_token"] = next_page_token
+        task["units_used"] += units_used
+        task["n_results"] += len(video_ids)
+        task["n_new"] += n_new
+        task["last_new"] = n_new
+        known_ids = set(task["video_ids"])
+        task["video_ids"].extend(video_id for video_id in dict.fromkeys(video_ids) if video_id not in known_ids)
+        task["done"] = not next_page_token or task["pages_done"] >= task["max_pages"]
+        self.add_usage(units_used)
+
+    def add_usage(self, units_used):
+        '''
+        Adds API units to today's usage (e.g. units used by a page interrupted by the end of the quota) and saves the progress.
+        '''
+        day = quota_day()
+        self.state["usage"][day] = self.state["usage"].get(day, 0) + units_used
+        self.save()
+
+    def estimate(self):
+        '''
+        Returns the estimated cost of the remaining campaign: search pages, API units, transcripts to retrieve and days of quota.
+        '''
+        n_pages = 0
+        units = 0
+        n_transcripts = 0
+        for task in self.tasks():
+            if task["done"]:
+                continue
+            pages_left = task["max_pages"] - task["pages_done"]
+            n_new = self.expected_new(task)
+            n_pages += pages_left
+            units += pages_left * self.page_cost(task, n_new)
+            n_transcripts += int(pages_left * n_new)
+        daily_units = max(1, self.daily_quota - self.reserve)
+        return {"pages": n_pages, "units": units, "transcripts": n_transcripts, "days": math.ceil(units / daily_units)}
+
+    def summary(self):
+        '''
+        Returns a short description of the campaign progress.
+        '''
+        tasks = self.tasks()
+        n_done = sum(t["done"] for t in tasks)
+        n_new = sum(t["n_new"] for t in tasks)
+        units = sum(t["units_used"] for t in tasks)
+        estimate = self.estimate()
+        return "%d/%d tasks done, %d new videos for %d units, %d units used today. Remaining: ~%d pages, ~%d units, ~%d transcripts, ~%d days" % (
+            n_done, len(tasks), n_new, units, self.units_used_today(), estimate["pages"], estimate["units"], estimate["transcripts"], estimate["days"])
@@ -0,0 +1,329 @@
+import os
+import json
+import time
+import hashlib
+import inspect
+import sqlite3
+import multiprocessing
+import numpy as np
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from utils import clean_text, clean_text_batch, clean_comments_batch, BRACKETS_RE, WORDS_RE
+from store_utils import read_comments, make_folder
+
+
+### Cleaned comments ###
+
+def clean_comment_chunk(chunk):
+    '''
+    Function to clean a chunk of comments (run in the processes of the cleaning pool).
+
+    Args:
+    chunk (list): list of (video_id, texts) tuples
+
+    Returns:
+    list of (video_id, cleaned texts) tuples
+    '''
+    return [(video_id, clean_comments_batch(texts)) for video_id, texts in chunk]
+
+
+def comment_chunks(comments_dir, chunk_size):
+    '''
+    Function to read the stored comments in chunks of about chunk_size comments, keeping only the text of each comment.
+    '''
+    chunk = []
+    size = 0
+    for video_id, comments in read_comments(comments_dir):
+        chunk.append((video_id, [item[1] for item in comments]))
+        size += len(comments)
+        if size >= chunk_size:
+            yield chunk
+            chunk = []
+            size = 0
+    if chunk:
+        yield chunk
+
+
+def ordered_results(executor, chunks, max_pending):
+    '''
+    Function to clean chunks in the pool, yielding the results in order. Unlike executor.map, chunks are read only
+    when there is room, so that at most max_pending chunks are in memory.
+    '''
+    pending = deque()
+    for chunk in chunks:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(clean_comment_chunk, chunk))
+    while pending:
+        yield pending.popleft().result()
+
+
+def comments_signature(comments_dir):
+    '''
+    Returns the name, size and modification time of the comment files, to know whether the cleaned comments are up to date.
+    '''
+    signature = {}
+    for file in sorted(os.listdir(comments_dir)):
+        stat = os.stat(os.path.join(comments_dir, file))
+        signature[file] = [stat.st_size, stat.st_mtime]
+    return signature
+
+
+def build_clean_comments(comments_dir="../data/comments/", path="../data/comments_clean.jsonl", n_workers=None, chunk_size=20000):
+    '''
+    Function to clean all stored comments once, with a pool of processes, and save the non-empty, deduplicated
+    (text, video id) pairs in a JSON lines file: {"Comment": ..., "VideoID": ...}. The order is the order of first
+    occurrence, as when comments are cleaned and deduplicated one video at a time.
+
+    Args:
+    comments_dir (str): folder with the comment files
+    path (str): path of the cleaned comments file
+    n_workers (int): number of processes, default is the number of CPU cores (1 to run in the current process)
+    chunk_size (int): approximate number of comments sent to a process at once
+
+    Returns:
+    n_comments (int): number of cleaned comments saved
+    '''
+    n_workers = n_workers or os.cpu_count() or 1
+    start_time = time.time()
+    signature = comments_signature(comments_dir)
+    make_folder(path)
+
+    # forked processes do not re-run the calling script, which is not always under a __main__ guard
+    if n_workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+        executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("fork"))
+        results = ordered_results(executor, comment_chunks(comments_dir, chunk_size), max_pending=2 * n_workers)
+    else:
+        executor = None
+        results = map(clean_comment_chunk, comment_chunks(comments_dir, chunk_size))
+
+    # digests of the pairs already written, smaller than the pairs themselves
+    seen = set()
+    n_comments = 0
+    try:
+        with open(path + ".tmp", "w") as f:
+            for chunk in results:
+                for video_id, texts in chunk:
+                    for text in texts:
+                        if text == "":
+                            continue
+                        digest = hashlib.md5((video_id + "\0" + text).encode("utf-8")).digest()
+                        if digest in seen:
+                            continue
+                        seen.add(digest)
+                        f.write(json.dumps({"Comment": text, "VideoID": video_id}) + "\n")
+                        n_comments += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # the signature is saved with the comments, the file is replaced only when complete
+    os.replace(path + ".tmp", path)
+    with open(path + ".meta.json", "w") as f:
+        json.dump(signature, f)
+
+    print("Cleaned comments: %d saved in %s in %.1f seconds" % (n_comments, path, time.time() - start_time))
+    return n_comments
+
+
+def update_clean_comments(comments_dir="../data/comments/", path="../data/comments_clean.jsonl", n_workers=None):
+    '''
+    Function to clean the comments if the cleaned comments file is missing or older than the stored comments.
+
+    Args:
+    comments_dir (str): folder with the comment files
+    path (str): path of the cleaned comments file
+    n_workers (int): number of processes used if comments have to be cleaned
+    '''
+    up_to_date = False
+    if os.path.exists(path) and os.path.exists(path + ".meta.json"):
+        with open(path + ".meta.json", "r") as f:
+            up_to_date = json.load(f) == comments_signature(comments_dir)
+    if not up_to_date:
+        build_clean_comments(comments_dir, path, n_workers=n_workers)
+
+
+def read_clean_comments(path="../data/comments_clean.jsonl"):
+    '''
+    Function to iterate over the cleaned comments without loading them all in memory.
+
+    Returns:
+    generator of (cleaned text, video id) tuples
+    '''
+    with open(path, "r") as f:
+        for line in f:
+            record = json.loads(line)
+            yield record["Comment"], record["VideoID"]
+
+
+def load_clean_comments(comments_dir="../data/comments/", path="../data/comments_clean.jsonl", n_workers=None):
+    '''
+    Function to read the cleaned comments, cleaning them first if the file is missing or older than the stored comments.
+
+    Args:
+    comments_dir (str): folder with the comment files
+    path (str): path of the cleaned comments file
+    n_workers (int): number of processes used if comments have to be cleaned
+
+    Returns:
+    yt_comments (list): list of (cleaned text, video id) tuples, without empty texts and duplicates
+    '''
+    update_clean_comments(comments_dir, path, n_workers=n_workers)
+    return list(read_clean_comments(path))
+
+
+class CommentIndex:
+    '''
+    Index of the comments of each video, built once with one stable sort (O(n log n)): the positions of the comments
+    sorted by video (stable, so the comments of a video keep their order) and, for each video, the range of its
+    comments in that order.
+
+    Args:
+    video_ids (list): video id of each comment, e.g. [item[1] for item in yt_comments]
+    '''
+
+    def __init__(self, video_ids):
+        self.codes = {}
+        comment_codes = np.fromiter((self.codes.setdefault(video_id, len(self.codes)) for video_id in video_ids), dtype=np.int64)
+        self.order = np.argsort(comment_codes, kind="stable")
+        self.offsets = np.zeros(len(self.codes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(comment_codes, minlength=len(self.codes)), out=self.offsets[1:])
+
+    def __contains__(self, video_id):
+        return video_id in self.codes
+
+    def indices(self, video_id):
+        '''
+        Returns the positions of the comments of a video, in increasing order (empty if the video has no comments).
+        '''
+        code = self.codes.get(video_id)
+        if code is None:
+            return self.order[:0]
+        return self.order[self.offsets[code]:self.offsets[code + 1]]
+
+    def indices_many(self, video_ids):
+        '''
+        Returns the positions of the comments of several videos, video after video.
+        '''
+        parts = [self.indices(video_id) for video_id in video_ids]
+        return np.concatenate(parts) if parts else self.order[:0]
+
+    def counts(self, video_ids):
+        '''
+        Returns the number of comments of each video (0 if the video has no comments).
+        '''
+        codes = np.array([self.codes.get(video_id, -1) for video_id in video_ids], dtype=np.int64)
+        # videos without comments (code -1) point to the appended 0
+        return np.append(np.diff(self.offsets), 0)[codes]
+
+
+### Cleaned transcripts ###
+
+def cleaning_signature():
+    '''
+    Returns the hash of the code of clean_text and clean_text_batch, so that texts cleaned before a change of the
+    cleaning are not reused.
+    '''
+    source = inspect.getsource(clean_text) + inspect.getsource(clean_text_batch) + BRACKETS_RE.pattern + WORDS_RE.pattern
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+# computed once, the code does not change while the pipeline runs
+CLEANING_SIGNATURE = cleaning_signature()
+
+
+
+class CleanTextCache:
+    '''
+    Cache of the texts cleaned by clean_text, shared by all the scripts of the pipeline. Texts are identified by the hash
+    of their content, of the cleaning parameters and of the cleaning code, so each transcript is cleaned once per set
+    of parameters (and again if the cleaning changes).
+    Cleaned texts are stored in a SQLite file, and the most recently used ones are also kept in memory.
+
+    Args:
+    path (str): path of the SQLite file
+    max_memory (int): maximum number of cleaned texts kept in memory
+    '''
+
+    def __init__(self, path="../data/clean_text_cache.sqlite", max_memory=100000):
+        self.path = path
+        self.max_memory = max_memory
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        make_folder(path)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cleaned (key TEXT PRIMARY KEY, text TEXT)")
+        self.connection.commit()
+
+    @staticmethod
+    def make_keys(texts, STOPWORDS, topic_model):
+        '''
+        Function to build the cache key of each text from its content, the cleaning parameters and the cleaning code.
+        '''
+        parameters = json.dumps([sorted(set(STOPWORDS)), topic_model]) if topic_model else json.dumps([[], False])
+        parameters += CLEANING_SIGNATURE
+        prefix = hashlib.sha256(parameters.encode("utf-8")).digest()
+        return [hashlib.sha256(prefix + text.encode("utf-8")).hexdigest() for text in texts]
+
+    def clean(self, texts, STOPWORDS=[], topic_model=False):
+        '''
+        Function to clean texts as clean_text_batch does, cleaning only the texts not cleaned before.
+
+        Args:
+        texts (iterable): texts, e.g. a list or a pandas Series
+        STOPWORDS (list): list of stopwords to remove, default is empty list
+        topic_model (bool): if True, also remove stopwords and numbers
+
+        Returns:
+        cleaned (list): cleaned texts, in the same order
+        '''
+        texts = list(texts)
+        keys = self.make_keys(texts, STOPWORDS, topic_model)
+        cleaned = {}
+
+        # texts in memory
+        for key in keys:
+            if key in self.memory and key not in cleaned:
+                self.memory.move_to_end(key)
+                cleaned[key] = self.memory[key]
+                self.memory_hits += 1
+
+        # texts on disk
+        missing = list(dict.fromkeys(key for key in keys if key not in cleaned))
+        for i in range(0, len(missing), 500):
+            batch = missing[i:i+500]
+            rows = self.connection.execute("SELECT key, text FROM cleaned WHERE key IN (%s)" % ",".join("?" * len(batch)), batch).fetchall()
+            cleaned.update(rows)
+            self.disk_hits += len(rows)
+
+        # texts never cleaned
+        new = {}
+        for key, text in zip(keys, texts):
+            if key not in cleaned and key not in new:
+                new[key] = text
+        if new:
+            new_cleaned = clean_text_batch(new.values(), STOPWORDS, topic_model=topic_model)
+            rows = list(zip(new.keys(), new_cleaned))
+            self.connection.executemany("INSERT OR REPLACE INTO cleaned VALUES (?, ?)", rows)
+            self.connection.commit()
+            cleaned.update(rows)
+            self.misses += len(rows)
+
+        # most recently used texts kept in memory
+        for key in dict.fromkeys(keys):
+            self.memory[key] = cleaned[key]
+            self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory:
+            self.memory.popitem(last=False)
+
+        return [cleaned[key] for key in keys]
+
+    def stats(self):
+        '''
+        Returns the number of texts found in memory, found on disk and cleaned.
+        '''
+        return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses}
@@ -0,0 +1,460 @@
+import os
+import time
+import hashlib
+import multiprocessing
+import numpy as np
+from scipy.sparse import csr_matrix
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import torch
+from sentence_transformers import SentenceTransformer
+from store_utils import scan_jsonl, append_jsonl
+
+
+### Sentence embeddings ###
+
+# good performance, fast according to https://www.sbert.net/docs/pretrained_models.html
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+# models loaded in the current process, by model name and device
+_models = {}
+
+def detect_device():
+    '''
+    Returns the best available torch device: "cuda", then "mps" (Apple GPUs), then "cpu".
+    '''
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def load_encoder(model_name=MODEL_NAME, device=None, n_threads=None, quantize=False):
+    '''
+    Function to load a SentenceTransformer model once in the current process, on the best available device.
+
+    Args:
+    model_name (str): SentenceTransformer model name
+    device (str): torch device, default is detect_device()
+    n_threads (int): number of CPU threads used by torch on CPU, default is the number of CPU cores
+    quantize (bool): if True, linear layers are dynamically quantized to int8 (CPU only, faster, slightly different embeddings)
+
+    Returns:
+    model (SentenceTransformer): the loaded model
+    '''
+    device = "cpu" if quantize else (device or detect_device())
+    if device == "cpu":
+        torch.set_num_threads(n_threads or os.cpu_count() or 1)
+
+    if (model_name, device, quantize) not in _models:
+        print("Loading", model_name, "on", device + (" (int8)" if quantize else ""), flush=True)
+        model = SentenceTransformer(model_name, device=device)
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        _models[(model_name, device, quantize)] = model
+    return _models[(model_name, device, quantize)]
+
+
+def encode(sentences, normalize=False, model_name=MODEL_NAME, device=None, batch_size=None, show_progress_bar=True, quantize=False):
+    '''
+    Function to encode sentences with the model loaded by load_encoder.
+
+    Args:
+    sentences (list): list of texts
+    normalize (bool): if True, embeddings have unit length
+    model_name (str): SentenceTransformer model name
+    device (str): torch device, default is detect_device()
+    batch_size (int): number of sentences per batch, default is 128 on GPU and 32 on CPU
+    quantize (bool): if True, use the int8 model (CPU only)
+
+    Returns:
+    embeddings (np.ndarray): one row per sentence
+    '''
+    device = "cpu" if quantize else (device or detect_device())
+    model = load_encoder(model_name, device, quantize=quantize)
+    if batch_size is None:
+        batch_size = 32 if device == "cpu" else 128
+    return model.encode(sentences, batch_size=batch_size, show_progress_bar=show_progress_bar, normalize_embeddings=normalize, convert_to_numpy=True)
+
+
+### CPU encoding pool ###
+
+# settings of the encoder of the current pool process
+_worker = {}
+
+def init_encoder_worker(cores_queue, model_name, quantize, batch_size):
+    '''
+    Function to load one model replica in a process of the encoding pool (used as initializer of the pool). The process
+    takes a subset of CPU cores from cores_queue, is pinned to it and uses one torch thread per core.
+    '''
+    cores = cores_queue.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    load_encoder(model_name, "cpu", n_threads=len(cores), quantize=quantize)
+    _worker.update(model_name=model_name, quantize=quantize, batch_size=batch_size)
+
+
+def encode_part(sentences, normalize):
+    '''
+    Function to encode a part of the sentences in a process of the encoding pool.
+    '''
+    return encode(sentences, normalize=normalize, model_name=_worker["model_name"], device="cpu", batch_size=_worker["batch_size"],
+                  show_progress_bar=False, quantize=_worker["quantize"])
+
+
+class EncoderPool:
+    '''
+    Pool of processes encoding sentences on CPU, one model replica per process, each pinned to its own subset of
+    cores. On many-core machines this is faster than one model using all cores, as a single encode call does not
+    keep all cores busy. Instances can be called like encode, e.g. as encode_function of EmbeddingStore.
+
+    Args:
+    n_workers (int): number of processes, default is the number of CPU cores divided by 4 (each process uses at least one core)
+    model_name (str): SentenceTransformer model name
+    normalize (bool): if True, embeddings have unit length
+    quantize (bool): if True, each process uses the int8 model
+    batch_size (int): number of sentences per batch
+    part_size (int): number of sentences sent to a process at once
+    '''
+
+    def __init__(self, n_workers=None, model_name=MODEL_NAME, normalize=False, quantize=False, batch_size=32, part_size=1000):
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        self.n_workers = max(1, min(n_workers or len(cores) // 4, len(cores)))
+        self.model_name = model_name
+        self.normalize = normalize
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.part_size = part_size
+
+        # forked processes do not re-run the calling script, which is not always under a __main__ guard
+        if self.n_workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            cores_queue = context.Queue()
+            for i in range(self.n_workers):
+                cores_queue.put(cores[i::self.n_workers])
+            self.executor = ProcessPoolExecutor(max_workers=self.n_workers, mp_context=context, initializer=init_encoder_worker,
+                                                initargs=(cores_queue, model_name, quantize, batch_size))
+        else:
+            self.executor = None
+
+    def __call__(self, sentences):
+        '''
+        Function to encode sentences with the processes of the pool.
+
+        Args:
+        sentences (list): list of texts
+
+        Returns:
+        embeddings (np.ndarray): one row per sentence, in the same order
+        '''
+        sentences = list(sentences)
+        if self.executor is None:
+            return encode(sentences, normalize=self.normalize, model_name=self.model_name, device="cpu", batch_size=self.batch_size,
+                          show_progress_bar=False, quantize=self.quantize)
+        parts = [sentences[i:i+self.part_size] for i in range(0, len(sentences), self.part_size)]
+        embeddings = list(self.executor.map(encode_part, parts, [self.normalize] * len(parts)))
+        return np.concatenate(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+### Video-comments alignment ###
+
+def centroid_alignment(video_embeddings, comment_embeddings, counts):
+    '''
+    Function to compute the alignment of all videos with their comments at once: the cosine similarity between the
+    embedding of each video and the centroid of the embeddings of its comments. Centroids are computed with a single
+    product by a sparse video x comment averaging matrix (faster than np.add.reduceat along rows).
+
+    Args:
+    video_embeddings (np.ndarray): one row per video
+    comment_embeddings (np.ndarray): one row per comment, comments sorted by video (e.g. in the order of CommentIndex.indices_many)
+    counts (np.ndarray): number of comments of each video, e.g. CommentIndex.counts
+
+    Returns:
+    cosine (np.ndarray): cosine similarity of each video, NaN for videos without comments
+    '''
+    counts = np.asarray(counts, dtype=np.int64)
+    comment_embeddings = np.asarray(comment_embeddings)
+    cosine = np.full(len(counts), np.nan)
+    has_comments = counts > 0
+    if not has_comments.any():
+        return cosine
+
+    # row i averages the comments of video i, i.e. the rows offsets[i] to offsets[i+1] of comment_embeddings
+    offsets = np.append(0, np.cumsum(counts))
+    weights = np.repeat(1.0 / np.maximum(counts, 1), counts).astype(comment_embeddings.dtype)
+    averaging = csr_matrix((weights, np.arange(offsets[-1]), offsets), shape=(len(counts), len(comment_embeddings)))
+    centroids = np.asarray(averaging @ comment_embeddings, dtype=np.float64)[has_comments]
+
+    videos = np.asarray(video_embeddings, dtype=np.float64)[has_comments]
+    cosine[has_comments] = np.einsum("ij,ij->i", videos, centroids) / (np.linalg.norm(videos, axis=1) * np.linalg.norm(centroids, axis=1))
+    return cosine
+
+
+### Silhouette scores ###
+
+def silhouette_block(embeddings, norms, codes, sums, sizes, start, end):
+    '''
+    Function to compute the silhouette scores of the rows start to end (see silhouette_scores).
+    '''
+    rows = np.arange(end - start)
+    own = codes[start:end]
+    n_own = sizes[own]
+    # dot products of each row with the sum of the rows of each cluster
+    dots = embeddings[start:end] @ sums.T
+
+    # mean distance to the other rows of the own cluster (the row itself excluded), and to the rows of each other cluster
+    a = ((n_own - 1) - (dots[rows, own] - norms[start:end] ** 2)) / np.maximum(n_own - 1, 1)
+    distances = 1 - dots / sizes
+    distances[rows, own] = np.inf
+    b = distances.min(axis=1)
+
+    # 0 / 0 when a == b == 0 (e.g. duplicate embeddings), the score is 0 as in sklearn
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = np.nan_to_num((b - a) / np.maximum(a, b))
+    # as in sklearn, the score of a row alone in its cluster is 0
+    scores[n_own == 1] = 0
+    return scores
+
+
+def silhouette_scores(embeddings, labels, block_size=4096, n_workers=None):
+    '''
+    Function to compute the silhouette score of each row with the cosine distance, as sklearn.metrics.silhouette_samples(
+    embeddings, labels, metric="cosine") but without the distance matrix. For rows of unit length, the mean cosine
+    distance of a row to the rows of a cluster is 1 - the dot product of the row with the mean of the cluster, so the
+    scores only need the product of the rows with the sums of each cluster: time is linear in the number of rows, and
+    memory is bounded by block_size x number of clusters.
+
+    Args:
+    embeddings (np.ndarray): one row per sample
+    labels (list): cluster label of each row
+    block_size (int): number of rows scored at once
+    n_workers (int): number of threads scoring blocks, default is the number of CPU cores
+
+    Returns:
+    scores (np.ndarray): silhouette score of each row
+    '''
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    norms = np.linalg.norm(embeddings, axis=1)
+    # rows of length zero stay zero (cosine distance 1 to all rows), as in sklearn
+    embeddings = embeddings / np.where(norms > 0, norms, 1)[:, None]
+    norms = (norms > 0).astype(np.float64)
+
+    clusters, codes = np.unique(np.asarray(labels), return_inverse=True)
+    if not 2 <= len(clusters) <= len(embeddings) - 1:
+        raise ValueError("Number of labels is %d. Valid values are 2 to n_samples - 1 (inclusive)" % len(clusters))
+    sizes = np.bincount(codes, minlength=len(clusters))
+    # sum of the rows of each cluster, as the product by a sparse cluster x row indicator matrix
+    indicator = csr_matrix((np.ones(len(codes)), (codes, np.arange(len(codes)))), shape=(len(clusters), len(codes)))
+    sums = np.asarray(indicator @ embeddings)
+
+    # blocks are independent, numpy releases the GIL during the products
+    bounds = [(start, min(start + block_size, len(embeddings))) for start in range(0, len(embeddings), block_size)]
+    with ThreadPoolExecutor(max_workers=n_workers or os.cpu_count() or 1) as executor:
+        blocks = executor.map(lambda bound: silhouette_block(embeddings, norms, codes, sums, sizes, *bound), bounds)
+        return np.concatenate(list(blocks))
+
+
+### Embedding store ###
+
+class EmbeddingStore:
+    '''
+    Persistent store of embeddings, keyed by the hash of the embedded text, so that a text is encoded once whatever
+    the narrative, the challenge or the run it appears in.
+
+    Embeddings are saved in blocks (one .npy file per call to add, opened memory-mapped), and each line of index.jsonl
+    lists the keys of the rows of one block: {"Block": ..., "Keys": [...]}. A block is listed in the index only once
+    it is completely written.
+
+    Embeddings stay on disk, but the index (key -> block and row) is loaded in memory: O(corpus), about 200 bytes
+    per stored text.
+
+    Args:
+    path (str): folder of the store, one store per model and normalization, e.g. "./embedding_data/store_all-MiniLM-L6-v2_norm"
+    dtype (str): type of the saved embeddings, "float32" or "float16" (half the size)
+    '''
+
+    def __init__(self, path, dtype="float32"):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.index_path = os.path.join(path, "index.jsonl")
+        self.rows = {}
+        self.blocks = {}
+        self.n_blocks = 0
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+        if os.path.exists(self.index_path):
+            for _, record in scan_jsonl(self.index_path):
+                for row, key in enumerate(record["Keys"]):
+                    self.rows.setdefault(key, (record["Block"], row))
+                self.n_blocks = max(self.n_blocks, record["Block"] + 1)
+
+    @staticmethod
+    def make_key(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def __contains__(self, text):
+        return self.make_key(text) in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def block(self, block_id):
+        '''
+        Returns a block of embeddings, memory-mapped (rows are read from disk when accessed).
+        '''
+        if block_id not in self.blocks:
+            self.blocks[block_id] = np.load(os.path.join(self.path, "block_%d.npy" % block_id), mmap_mode="r")
+        return self.blocks[block_id]
+
+    def add(self, texts, embeddings):
+        '''
+        Adds the embeddings of texts, texts already in the store are skipped.
+
+        Args:
+        texts (list): embedded texts
+        embeddings (np.ndarray): one row per text
+        '''
+        keys = []
+        selected = []
+        new_keys = set()
+        for i, text in enumerate(texts):
+            key = self.make_key(text)
+            if key not in self.rows and key not in new_keys:
+                new_keys.add(key)
+                keys.append(key)
+                selected.append(i)
+        if not keys:
+            return
+
+        # write the block before listing it in the index
+        block_id = self.n_blocks
+        block_path = os.path.join(self.path, "block_%d.npy" % block_id)
+        with open(block_path + ".tmp", "wb") as f:
+            np.save(f, np.asarray(embeddings)[selected].astype(self.dtype))
+        os.replace(block_path + ".tmp", block_path)
+        append_jsonl(self.index_path, [{"Block": block_id, "Keys": keys}])
+
+        for row, key in enumerate(keys):
+            self.rows[key] = (block_id, row)
+        self.n_blocks += 1
+
+    def get(self, text):
+        '''
+        Returns the embedding of a text, without copy (a row of the memory-mapped block). Raises KeyError if the text is not in the store.
+        '''
+        block_id, row = self.rows[self.make_key(text)]
+        return self.block(block_id)[row]
+
+    def get_many(self, texts):
+        '''
+        Returns the embeddings of texts, one row per text in the same order. Raises KeyError if a text is not in the store.
+        '''
+        locations = np.array([self.rows[self.make_key(text)] for text in texts], dtype=np.int64).reshape(-1, 2)
+        dim = self.block(0).shape[1] if self.n_blocks > 0 else 0
+        embeddings = np.empty((len(locations), dim), dtype=self.dtype)
+        # rows of the same block are read together
+        for block_id in np.unique(locations[:, 0]):
+            in_block = locations[:, 0] == block_id
+            embeddings[in_block] = self.block(block_id)[locations[in_block, 1]]
+        return embeddings
+
+    def add_missing(self, texts, encode_function):
+        '''
+        Function to encode and add the texts not in the store.
+
+        Args:
+        texts (list): texts
+        encode_function (function): function returning the embeddings of a list of texts, e.g. encode
+
+        Returns:
+        n_new (int): number of texts encoded
+        '''
+        missing = list(dict.fromkeys(text for text in texts if text not in self))
+        if missing:
+            print("Encoding %d new texts (%d in the store)" % (len(missing), len(self)), flush=True)
+            self.add(missing, encode_function(missing))
+        return len(missing)
+
+    def add_streaming(self, texts, encode_function, chunk_size=10000, batch_size=32, sort_window=8):
+        '''
+        Function to encode the texts not in the store in chunks of chunk_size texts. Each chunk is saved as soon as
+        it is encoded, so an interrupted run resumes after the last saved chunk. Within a chunk, texts are sorted by
+        length in windows of sort_window batches, so that batches hold texts of similar length (less padding).
+
+        Texts and embeddings in memory are bounded by chunk_size; the index of the store (one key per stored text,
+        see __init__) is kept in memory and grows with the corpus.
+
+        Args:
+        texts (iterable): texts, e.g. a generator reading them from disk
+        encode_function (function): function returning the embeddings of a list of texts, e.g. encode
+        chunk_size (int): number of texts per chunk
+        batch_size (int): number of texts per batch of encode_function
+        sort_window (int): number of batches sorted by length together
+
+        Returns:
+        n_new (int): number of texts encoded
+        '''
+        n_new = 0
+        n_seconds = 0.0
+        chunk = {}
+        for text in texts:
+            key = self.make_key(text)
+            if key in self.rows or key in chunk:
+                continue
+            chunk[key] = text
+            if len(chunk) < chunk_size:
+                continue
+
+            n_seconds += self.encode_chunk(list(chunk.values()), encode_function, batch_size * sort_window)
+            n_new += len(chunk)
+            chunk = {}
+
+        if chunk:
+            n_seconds += self.encode_chunk(list(chunk.values()), encode_function, batch_size * sort_window)
+            n_new += len(chunk)
+
+        if n_new > 0:
+            print("Encoded %d texts, %.1f sentences/s" % (n_new, n_new / n_seconds), flush=True)
+        return n_new
+
+    def encode_chunk(self, texts, encode_function, window):
+        '''
+        Function to encode a chunk of texts, sorted by length in windows of window texts, and save it in a block.
+
+        Returns:
+        n_seconds (float): time spent encoding
+        '''
+        # longest texts first in each window, as in SentenceTransformer.encode
+        texts = [text for i in range(0, len(texts), window) for text in sorted(texts[i:i+window], key=len, reverse=True)]
+        start_time = time.time()
+        embeddings = encode_function(texts)
+        n_seconds = time.time() - start_time
+        self.add(texts, embeddings)
+        print("Chunk of %d texts saved (%d in the store), %.1f sentences/s" % (len(texts), len(self), len(texts) / n_seconds), flush=True)
+        return n_seconds
+
+    def encode(self, texts, encode_function):
+        '''
+        Function to get the embeddings of texts, encoding only the texts not in the store.
+
+        Args:
+        texts (list): texts
+        encode_function (function): function returning the embeddings of a list of texts, e.g. encode
+
+        Returns:
+        embeddings (np.ndarray): one row per text, in the same order
+        '''
+        texts = list(texts)
+        self.add_missing(texts, encode_function)
+        return self.get_many(texts)
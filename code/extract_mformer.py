@@ -6,9 +6,8 @@ import spacy
 nlp = spacy.load('en_core_web_sm')
 import warnings
 import pandas as pd
-from transformers import AutoModelForSequenceClassification
-from roberta_utils import predict
-from utils import clean_text
+from mformer_utils import score_labelers
+from cleaning_utils import CleanTextCache
 
 #### Define arguments ####
 tag = "nomeatmay"
@@ -25,13 +24,16 @@ else:
     output_path = data_path+"retrieved_videos_mformer_baseline.csv"
 device = "cuda" # "cuda" or "cpu"
 batch_size = 32
+# texts are tokenized once for the five models, tokens are saved and reused while the texts are the same
+tokens_path = output_path.replace(".csv", "_tokens.npz")
 
 #### Functions definition ####
 
 # score texts using mformer models
-def predict_df(df, text_col, output_path, device="cuda", batch_size=32):
+def predict_df(df, text_col, output_path, device="cuda", batch_size=32, tokens_path=None):
     """
-    Use a RobertaForSequenceClassification model to predict a list of texts.
+    Use the RobertaForSequenceClassification models in labelers to predict a list of texts. Texts are tokenized once
+    and sorted by length, and every model runs over the same dynamically padded batches.
 
     Args:
         df: a dataframe with a column of texts
@@ -39,18 +41,16 @@ def predict_df(df, text_col, output_path, device="cuda", batch_size=32):
         output_path: path to save the dataframe with the scores
         device: torch device. Defaults to "cuda".
         batch_size: batch size. Defaults to 32.
+        tokens_path: path to save the tokens of the texts. Defaults to None (not saved).
 
     Returns:
         a dataframe with the scores for the texts in df
     """
-    for f, path in labelers.items():
-        print(f, flush=True)
-        print(path, flush=True)
-        model = AutoModelForSequenceClassification.from_pretrained(path)
-        model.to(device)
-        y_score = predict(X=df[text_col].tolist(), model=model, batch_size=batch_size, path=path, device=device)
-        df[f"{f}_score"] = y_score
+    scores = score_labelers(df[text_col].tolist(), labelers, device=device, batch_size=batch_size, cache_path=tokens_path)
+    # the five score columns are written together
+    df = df.assign(**{f"{f}_score": y_score for f, y_score in scores.items()})
     df.to_csv(output_path)
+    return df
 
     
 #### Clean Video Transcript column ####
@@ -76,8 +76,9 @@ retrieved_videos = retrieved_videos[retrieved_videos["Video Transcript"].notnull
 if not is_baseline:
     retrieved_videos = retrieved_videos[retrieved_videos["topic"]==topic_n] 
 
-# apply clean function to Video Transcript column
-retrieved_videos['Video Transcript Clean'] = retrieved_videos['Video Transcript'].apply(lambda x: clean_text(x))
+# apply clean function to Video Transcript column (cleaned transcripts are shared by all scripts)
+clean_cache = CleanTextCache("../data/clean_text_cache.sqlite")
+retrieved_videos['Video Transcript Clean'] = clean_cache.clean(retrieved_videos['Video Transcript'])
 # remove all rows for which Video Transcript Clean is empty and reset index
 retrieved_videos = retrieved_videos[retrieved_videos['Video Transcript Clean'] != ''].reset_index(drop=True)
 
@@ -111,7 +112,8 @@ predict_df(df=retrieved_videos,
             text_col=text_col,
             output_path=output_path,
             device=device,
-            batch_size=batch_size)
+            batch_size=batch_size,
+            tokens_path=tokens_path)
 
 if verbose:
     print("Done!", flush=True)
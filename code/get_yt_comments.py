@@ -1,8 +1,8 @@
 # import required modules
 from pathlib import Path
 import pandas as pd
-import json
-from utils import youtube_authenticate, get_video_comments
+from utils import get_credentials, build_service, harvest_comments, RateLimiter, ResponseCache, CachedService
+from store_utils import CommentStore
 
 
 # define tag
@@ -15,10 +15,32 @@ if not Path("../data/comments").exists():
 # define scopes for API access
 SCOPES = ["https://www.googleapis.com/auth/youtube.force-ssl"]
 
+# number of parallel threads, each with its own API client
+n_workers = 8
+# API limits shared by all threads
+requests_per_second = 10
+daily_quota = 10000
+
+# cache API responses on disk, shared by all threads
+# (replay_only: only use cached responses, without authenticating)
+use_cache = True
+replay_only = False
+
 
 #### Main program, data retrieval ####
 
-youtube = youtube_authenticate(SCOPES)
+# authenticate once in the main thread, the threads build their own client from the same credentials
+# (token.pickle is only read and written here)
+if not (use_cache and replay_only):
+    credentials = get_credentials(SCOPES)
+
+def service_factory():
+    if not use_cache:
+        return build_service(credentials)
+    return CachedService(build_service(credentials) if not replay_only else None, cache)
+
+if use_cache:
+    cache = ResponseCache("./api_cache.sqlite", replay_only=replay_only)
 
 # open transcript file
 df_videos = pd.read_csv("../data/"+tag+"/video_ids_mformer.csv")
@@ -29,40 +51,18 @@ df_videos = df_videos.drop_duplicates(subset="Video ID")
 # get list of video ids
 video_ids = df_videos["Video ID"].tolist()
 
-video_data = []
-iter_videos = 0 
-all_data = []
-
-for video_id in video_ids:
-
-    # if json file already exists, open
-    if Path(f"../data/comments/"+tag+".json").exists():
-        with open(f"../data/comments/"+tag+".json", "r") as f:
-            all_data = json.load(f) # in this way, we will overwrite the json file if we run the script again
-        
-        # if video already in json, skip
-        if any(d["VideoID"] == video_id for d in all_data):
-            iter_videos += 1
-            
-            if iter_videos % 10 == 0:
-                print("N. videos:", iter_videos ,"/", len(video_ids))
-
-            continue
-
-    comments = get_video_comments(youtube, video_id=video_id)
-    
-    video_data = {
-        'VideoID': video_id,
-        'Comments': comments
-    }
-
-    all_data.append(video_data)
+# open the comment store, videos already retrieved are skipped
+# (comments saved by earlier runs in ../data/comments/<tag>.json are imported)
+store = CommentStore("../data/comments/"+tag+".jsonl")
+video_ids_todo = [video_id for video_id in video_ids if video_id not in store]
+print("N. videos:", len(video_ids) - len(video_ids_todo), "/", len(video_ids), "already retrieved")
 
-    iter_videos += 1
+limiter = RateLimiter(requests_per_second=requests_per_second, daily_quota=daily_quota)
+stats = harvest_comments(video_ids_todo, service_factory, n_workers=n_workers, limiter=limiter, on_result=store.append)
 
-    if iter_videos % 10 == 0:
-        print("N. videos:", iter_videos ,"/", len(video_ids))
+# failed videos are not saved, they will be retried at the next run
+if stats["failed"]:
+    print("Failed videos:", [video_id for video_id, _ in stats["failed"]])
 
-    # save as json
-    with open("../data/comments/"+tag+".json", "w") as f:
-        json.dump(all_data, f, indent=4)
+if use_cache:
+    print("API cache:", cache.stats())
@@ -1,46 +1,70 @@
 # import required modules
-from youtube_transcript_api import YouTubeTranscriptApi
 import os
 import pickle
 import pandas as pd
-from utils import youtube_authenticate, search_videos, get_video_details
+from utils import youtube_authenticate, search_videos_page, get_videos_details, ResponseCache, CachedService, RateLimiter, QuotaExceededError
+from store_utils import VideoRegistry, TranscriptStore
+from transcript_utils import get_transcripts
+from campaign_utils import CampaignScheduler, make_task
 
 #### Global variables ####
 SCOPES = ["https://www.googleapis.com/auth/youtube.force-ssl"]
 
 #### Main program, data retrieval ####
 
-# set keyword and tag (i.e. challenge of interest)
-KEYWORD = "hey"
-tag = "veganury"
+# set tags (i.e. challenges of interest) with their keywords, time window and priority
+# keywords found with get_common_hashtags.py can be added to the list and the script run again
+CAMPAIGN = {
+    "veganuary": {
+        "keywords": ["veganuary"],
+        # change start and end date according to the reference challenge
+        "window": lambda YEAR: (str(YEAR-1)+"-12-01T00:00:00Z", str(YEAR)+"-02-01T00:00:00Z"),
+        "priority": 1.0,
+    },
+}
+YEARS = range(2014, 2024)
 # define whether we are looking fot target or baseline videos
 baseline = False
 
-# loop over years
-for YEAR in range(2014, 2024):
-    # change start and end date according to the reference challenge
-    START_DATE = str(YEAR-1)+"-12-01T00:00:00Z"
-    END_DATE = str(YEAR)+"-02-01T00:00:00Z"
+# number of parallel threads for transcript retrieval
+n_workers_transcripts = 8
 
-    youtube = youtube_authenticate(SCOPES)
+# API units available per day, and units left for the other scripts
+daily_quota = 10000
+reserve = 0
 
-    # Step 1: Search for videos based on the keyword
-    if baseline:
-        # Search for videos based on the keyword, video category id 22 (People & Blogs, most popular category)
-        search_results = search_videos(youtube, threshold_api_units = 8000, n_nextpage=4, publishedAfter=START_DATE, publishedBefore=END_DATE, relevanceLanguage="en", videoCategoryId=22, type="video", part='id', maxResults=50, order="date")
-    else:
-        earch_results = search_videos(youtube, threshold_api_units = 8000, n_nextpage=10, q=KEYWORD, publishedAfter=START_DATE, publishedBefore=END_DATE, relevanceLanguage="en", type="video", part='id', maxResults=50, order="date")
-    
+# cache API responses on disk, so that re-running a year or a keyword does not use the API again
+# (replay_only: only use cached responses, without authenticating)
+use_cache = True
+replay_only = False
+if use_cache:
+    cache = ResponseCache("./api_cache.sqlite", replay_only=replay_only)
+
+#### Functions definition ####
+
+def get_video_rows(youtube, video_ids, limiter):
+    '''
+    Function to retrieve the details of videos as rows of the retrieved videos dataframe.
+
+    Args:
+    youtube: the YouTube API service object already initialized
+    video_ids (list): list of video ids
+    limiter (RateLimiter): limiter counting the API units used
+
+    Returns:
+    video_data (list): list of dicts, one per video with details
+    '''
     video_data = []
-    
-    for video in search_results:
-        video_id = video['id']['videoId']
-        
-        # Step 2: Retrieve video details
-        video_details = get_video_details(youtube, video_id)
-        
+
+    # retrieve video details, 50 videos per request
+    all_video_details, missing_ids = get_videos_details(youtube, video_ids, limiter=limiter)
+    if missing_ids:
+        print("No details for %d videos." % len(missing_ids))
+
+    for video_id, video_details in zip(video_ids, all_video_details):
+
         if video_details:
-            video_channel = video_details['snippet']['channelId']   
+            video_channel = video_details['snippet']['channelId']
             video_title = video_details['snippet']['title']
             video_description = video_details['snippet']['description']
             video_timestamp = video_details['snippet']['publishedAt']
@@ -62,7 +86,7 @@ for YEAR in range(2014, 2024):
             except:
                 video_comment_count = None
 
-            
+
             video_data.append({
                 'Video ID': video_id,
                 'Channel ID': video_channel,
@@ -76,46 +100,97 @@ for YEAR in range(2014, 2024):
                 'Video Comment Count': video_comment_count
             })
 
-    # Step 3: Create a DataFrame structure
-    df = pd.DataFrame(video_data)
+    return video_data
 
-    # get transcripts if automatic caption is available
-    try:
-        video_ids = list(df["Video ID"].values)
 
-        transcript_list, unretrievable_videos = YouTubeTranscriptApi.get_transcripts(video_ids, continue_after_error=True)
+#### Plan the campaign ####
+
+tasks = []
+for tag, campaign in CAMPAIGN.items():
+    for KEYWORD in campaign["keywords"]:
+        for YEAR in YEARS:
+            START_DATE, END_DATE = campaign["window"](YEAR)
+            tasks.append(make_task(tag, KEYWORD, YEAR, START_DATE, END_DATE, baseline=baseline, priority=campaign["priority"], max_pages=5 if baseline else 11))
+
+# progress is saved after every page, the campaign resumes where it stopped at the next run
+scheduler = CampaignScheduler("./data/campaign_"+("baseline" if baseline else "target")+".json", daily_quota=daily_quota, reserve=reserve)
+scheduler.add_tasks(tasks)
+print(scheduler.summary())
 
-        list_transcripts = []
+#### Run the campaign, one search page at a time ####
 
-        for video_id in video_ids:
+youtube = youtube_authenticate(SCOPES) if not (use_cache and replay_only) else None
+if use_cache:
+    youtube = CachedService(youtube, cache)
 
-            if video_id in transcript_list.keys():
+# videos whose details were already retrieved by earlier tasks, and retrieved transcripts, per tag
+registries = {}
+transcript_stores = {}
 
-                srt = transcript_list.get(video_id)
+limiter = RateLimiter(daily_quota=scheduler.remaining_today())
 
-                text_list = []
-                for i in srt:
-                    text_list.append(i['text'])
+while True:
+    task = scheduler.next_task()
+    if task is None:
+        print("Campaign complete.")
+        break
 
-                text = '.'.join(text_list)
-                list_transcripts.append(text)
-                
-            else:
-                list_transcripts.append(None)
+    # stop when the page would exceed today's share of the quota
+    if scheduler.page_cost(task) > scheduler.remaining_today():
+        print("Daily quota used, run again tomorrow to continue.")
+        break
 
-        df["Video Transcript"] = list_transcripts
+    tag, KEYWORD, YEAR = task["tag"], task["keyword"], task["year"]
+    if tag not in registries:
+        registries[tag] = VideoRegistry("./data/"+tag+"/video_registry.jsonl")
+        transcript_stores[tag] = TranscriptStore("./data/"+tag+"/transcripts.jsonl")
+    registry = registries[tag]
+    units_before = limiter.units_used
 
-        # if data folder does not exist, create it
-        if not os.path.exists("./data/"+tag):
-            os.makedirs("./data/"+tag)
-        
-        # save as pickle
-        if baseline:
-            with open("./data/"+tag+"/retrieved_baseline_video_"+str(YEAR)+"_key_"+KEYWORD+".pickle", "wb") as token:    
-                pickle.dump(df, token)
+    # Step 1: Search for videos based on the keyword
+    try:
+        if task["baseline"]:
+            # Search for videos based on the keyword, video category id 22 (People & Blogs, most popular category)
+            search_results, next_page_token = search_videos_page(youtube, page_token=task["next_page_token"], limiter=limiter, publishedAfter=task["start_date"], publishedBefore=task["end_date"], relevanceLanguage="en", videoCategoryId=22, type="video", part='id', maxResults=50, order="date")
         else:
-            with open("./data/"+tag+"/retrieved_target_video_"+str(YEAR)+"_key_"+KEYWORD+".pickle", "wb") as token:    
-                pickle.dump(df, token)  
+            search_results, next_page_token = search_videos_page(youtube, page_token=task["next_page_token"], limiter=limiter, q=KEYWORD, publishedAfter=task["start_date"], publishedBefore=task["end_date"], relevanceLanguage="en", type="video", part='id', maxResults=50, order="date")
+
+        # Step 2: Retrieve details of the videos not in the registry
+        search_ids = list(dict.fromkeys(video['id']['videoId'] for video in search_results))
+        new_ids = [video_id for video_id in search_ids if video_id not in registry]
+        video_data = get_video_rows(youtube, new_ids, limiter)
+    except QuotaExceededError:
+        scheduler.add_usage(limiter.units_used - units_before)
+        print("Daily quota used, run again tomorrow to continue.")
+        break
+
+    # register new videos, so that other tasks do not retrieve them again
+    registry.add_many(video_data)
+
+    scheduler.record_page(task, next_page_token, search_ids, len(video_data), limiter.units_used - units_before)
+    print(task["id"], "page", task["pages_done"], ":", len(search_ids), "videos,", len(video_data), "new,", limiter.units_used - units_before, "units")
+
+    # Step 3: Create a DataFrame structure, merging new videos with those already retrieved, in search order
+    df = pd.DataFrame(registry.get_many([video_id for video_id in task["video_ids"] if video_id in registry]))
+    if len(df) == 0:
+        continue
+
+    # get transcripts if automatic caption is available, only for videos not retrieved before
+    df["Video Transcript"] = get_transcripts(list(df["Video ID"].values), transcript_stores[tag], n_workers=n_workers_transcripts)
+
+    # if data folder does not exist, create it
+    if not os.path.exists("./data/"+tag):
+        os.makedirs("./data/"+tag)
+
+    # save as pickle, updated after every page
+    if task["baseline"]:
+        with open("./data/"+tag+"/retrieved_baseline_video_"+str(YEAR)+"_key_"+KEYWORD+".pickle", "wb") as token:
+            pickle.dump(df, token)
+    else:
+        with open("./data/"+tag+"/retrieved_target_video_"+str(YEAR)+"_key_"+KEYWORD+".pickle", "wb") as token:
+            pickle.dump(df, token)
+
+print(scheduler.summary())
 
-    except:
-        print("No videos for "+str(YEAR)+".")  
+if use_cache:
+    print("API cache:", cache.stats())
@@ -0,0 +1,145 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from langdetect import DetectorFactory, detect
+from store_utils import scan_jsonl, append_jsonl, make_folder
+
+
+### Language identification ###
+
+# langdetect is random unless seeded
+DetectorFactory.seed = 0
+
+def detect_language(text, max_chars=1000):
+    '''
+    Function to detect the language of a text from its first max_chars characters.
+
+    Args:
+    text (str): text
+    max_chars (int): maximum number of characters used, the text is cut at the last space before the limit
+
+    Returns:
+    language (str): language code (e.g. "en"), None if the text is empty or the language cannot be detected
+    '''
+    if not isinstance(text, str):
+        return None
+    if len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        text = text[:cut if cut > 0 else max_chars]
+    try:
+        return detect(text)
+    except Exception:
+        return None
+
+
+def _init_detector():
+    DetectorFactory.seed = 0
+
+
+def detect_languages(texts, max_chars=1000, n_workers=4, chunksize=64):
+    '''
+    Function to detect the language of many texts with a pool of processes.
+
+    Args:
+    texts (list): list of texts
+    max_chars (int): maximum number of characters used per text
+    n_workers (int): number of processes (1 to run in the current process)
+    chunksize (int): number of texts sent to a process at once
+
+    Returns:
+    languages (list): language of each text, None where it cannot be detected
+    '''
+    texts = list(texts)
+    if n_workers <= 1 or len(texts) <= chunksize:
+        return [detect_language(text, max_chars) for text in texts]
+
+    # forked processes do not re-run the calling script, which is not always under a __main__ guard
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        return [detect_language(text, max_chars) for text in texts]
+
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=context, initializer=_init_detector) as executor:
+        return list(executor.map(detect_language, texts, [max_chars] * len(texts), chunksize=chunksize))
+
+
+class LanguageCache:
+    '''
+    Append-only cache of detected languages, one JSON line per video and field: {"Video ID": ..., "Field": ..., "Language": ...}.
+
+    Args:
+    path (str): path of the .jsonl file, e.g. "../data/<tag>/languages.jsonl"
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.languages = {}
+
+        make_folder(path)
+        if os.path.exists(path):
+            for _, record in scan_jsonl(path):
+                self.languages[(record["Video ID"], record["Field"])] = record["Language"]
+
+    def __contains__(self, key):
+        return key in self.languages
+
+    def get(self, video_id, field):
+        return self.languages.get((video_id, field))
+
+    def add_many(self, video_ids, field, languages):
+        '''
+        Stores the languages detected for a field of several videos, with a single write.
+        '''
+        records = []
+        for video_id, language in zip(video_ids, languages):
+            if (video_id, field) not in self.languages:
+                self.languages[(video_id, field)] = language
+                records.append({"Video ID": video_id, "Field": field, "Language": language})
+        if records:
+            append_jsonl(self.path, records, fsync=False)
+
+
+def language_mask(df, fields, language="en", cache=None, max_chars=1000, n_workers=4, id_column="Video ID"):
+    '''
+    Function to compute which rows of a dataframe are in a given language. The language of a row is detected on
+    the first field, and on the next fields for the rows where it cannot be detected (e.g. empty description).
+    Rows whose language cannot be detected in any field are kept.
+
+    Args:
+    df (pd.DataFrame): dataframe of videos
+    fields (list): columns used for detection, in order of preference (e.g. ["Video Description", "Video Title"])
+    language (str): language to keep
+    cache (LanguageCache): cache of the detected languages, only videos not in the cache are detected
+    max_chars (int): maximum number of characters used per text
+    n_workers (int): number of processes
+    id_column (str): column with the video ids used as cache keys
+
+    Returns:
+    keep (pd.Series): boolean mask aligned with df, True for the rows to keep
+    '''
+    detected = pd.Series([None] * len(df), index=df.index, dtype=object)
+    todo = df.index
+
+    for field in fields:
+        if len(todo) == 0:
+            break
+        texts = df.loc[todo, field]
+
+        if cache is not None:
+            video_ids = df.loc[todo, id_column]
+            cached = [video_id for video_id in video_ids if (video_id, field) in cache]
+            new = ~video_ids.isin(cached)
+            languages = detect_languages(texts[new].values, max_chars, n_workers)
+            cache.add_many(video_ids[new].values, field, languages)
+            field_languages = pd.Series([cache.get(video_id, field) for video_id in video_ids], index=todo, dtype=object)
+        else:
+            field_languages = pd.Series(detect_languages(texts.values, max_chars, n_workers), index=todo, dtype=object)
+
+        detected[todo] = field_languages
+        todo = field_languages.index[field_languages.isnull()]
+
+    if len(todo) > 0:
+        print("Language not detected for %d rows, kept" % len(todo))
+
+    return detected.isnull() | (detected == language)
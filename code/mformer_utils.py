@@ -0,0 +1,151 @@
+import os
+import time
+import hashlib
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+
+### Tokenization ###
+
+def texts_key(texts, tokenizer_path, max_length):
+    '''
+    Returns the hash of the texts and of the tokenization parameters, to know whether cached tokens can be reused.
+    '''
+    digest = hashlib.sha1(("%s\0%d\0" % (tokenizer_path, max_length)).encode("utf-8"))
+    for text in texts:
+        digest.update(text.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+def tokenize_texts(texts, tokenizer_path, max_length=512, cache_path=None, chunk_size=1000):
+    '''
+    Function to tokenize texts once, without padding, truncated to max_length tokens.
+
+    Args:
+    texts (list): list of texts
+    tokenizer_path (str): name or path of the tokenizer
+    max_length (int): maximum number of tokens per text
+    cache_path (str): path of the .npz file where tokens are saved, reused while texts and parameters are the same
+    chunk_size (int): number of texts tokenized at once
+
+    Returns:
+    input_ids (list): token ids of each text (np.ndarray)
+    pad_token_id (int): id of the padding token
+    '''
+    key = texts_key(texts, tokenizer_path, max_length)
+    if cache_path is not None and os.path.exists(cache_path):
+        cached = np.load(cache_path)
+        if str(cached["key"]) == key:
+            print("Tokens loaded from", cache_path, flush=True)
+            ids, offsets = cached["ids"], cached["offsets"]
+            return [ids[start:end] for start, end in zip(offsets[:-1], offsets[1:])], int(cached["pad_token_id"])
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+    input_ids = []
+    for i in range(0, len(texts), chunk_size):
+        encoded = tokenizer(texts[i:i+chunk_size], truncation=True, max_length=max_length)
+        input_ids.extend(np.asarray(ids, dtype=np.int32) for ids in encoded["input_ids"])
+
+    if cache_path is not None:
+        offsets = np.zeros(len(input_ids) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in input_ids], out=offsets[1:])
+        ids = np.concatenate(input_ids) if input_ids else np.empty(0, dtype=np.int32)
+        # the file is replaced only when complete
+        with open(cache_path + ".tmp", "wb") as f:
+            np.savez(f, key=key, ids=ids, offsets=offsets, pad_token_id=tokenizer.pad_token_id)
+        os.replace(cache_path + ".tmp", cache_path)
+
+    return input_ids, tokenizer.pad_token_id
+
+
+def length_batches(input_ids, batch_size):
+    '''
+    Function to group texts of similar length in batches, longest first, so that batches are padded to few tokens.
+
+    Returns:
+    batches (list): positions of the texts of each batch (np.ndarray)
+    '''
+    lengths = np.array([len(ids) for ids in input_ids])
+    order = np.argsort(-lengths, kind="stable")
+    return [order[i:i+batch_size] for i in range(0, len(order), batch_size)]
+
+
+def pad_batch(input_ids, pad_token_id):
+    '''
+    Function to pad the token ids of a batch to the longest text of the batch.
+
+    Returns:
+    ids (torch.Tensor): padded token ids, one row per text
+    attention_mask (torch.Tensor): 1 for tokens, 0 for padding
+    '''
+    length = max(len(ids) for ids in input_ids)
+    ids = np.full((len(input_ids), length), pad_token_id, dtype=np.int64)
+    attention_mask = np.zeros((len(input_ids), length), dtype=np.int64)
+    for i, row in enumerate(input_ids):
+        ids[i, :len(row)] = row
+        attention_mask[i, :len(row)] = 1
+    return torch.from_numpy(ids), torch.from_numpy(attention_mask)
+
+
+### Scoring ###
+
+def predict_tokenized(model, input_ids, pad_token_id, batches, device="cuda"):
+    '''
+    Function to score tokenized texts with a sequence classification model.
+
+    Args:
+    model (AutoModelForSequenceClassification): model, on device
+    input_ids (list): token ids of each text
+    pad_token_id (int): id of the padding token
+    batches (list): positions of the texts of each batch, e.g. length_batches
+    device (str): torch device
+
+    Returns:
+    scores (np.ndarray): probability of the positive class of each text, in the order of input_ids
+    '''
+    model.eval()
+    scores = np.empty(len(input_ids))
+    with torch.no_grad():
+        for batch in batches:
+            ids, attention_mask = pad_batch([input_ids[i] for i in batch], pad_token_id)
+            logits = model(input_ids=ids.to(device), attention_mask=attention_mask.to(device)).logits
+            scores[batch] = torch.softmax(logits, dim=1)[:, 1].cpu().numpy()
+    return scores
+
+
+def score_labelers(texts, labelers, device="cuda", batch_size=32, max_length=512, cache_path=None):
+    '''
+    Function to score texts with several models sharing the same tokenizer (e.g. the five mformer models): texts are
+    tokenized once, and every model runs over the same length-sorted batches.
+
+    Args:
+    texts (list): list of texts
+    labelers (dict): score name -> model name or path
+    device (str): torch device
+    batch_size (int): number of texts per batch
+    max_length (int): maximum number of tokens per text
+    cache_path (str): path of the .npz file where tokens are saved
+
+    Returns:
+    scores (dict): score name -> scores of the texts (np.ndarray)
+    '''
+    # all models share the tokenizer of the first one
+    start_time = time.time()
+    input_ids, pad_token_id = tokenize_texts(texts, next(iter(labelers.values())), max_length=max_length, cache_path=cache_path)
+    batches = length_batches(input_ids, batch_size)
+    print("Tokenization: %d texts in %.1f seconds" % (len(texts), time.time() - start_time), flush=True)
+
+    scores = {}
+    for f, path in labelers.items():
+        start_time = time.time()
+        model = AutoModelForSequenceClassification.from_pretrained(path)
+        model.to(device)
+        scores[f] = predict_tokenized(model, input_ids, pad_token_id, batches, device=device)
+        print("%s (%s): %.1f seconds" % (f, path, time.time() - start_time), flush=True)
+
+        # free the memory of the model before loading the next one
+        del model
+        if device == "cuda":
+            torch.cuda.empty_cache()
+    return scores
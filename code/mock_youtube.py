@@ -0,0 +1,182 @@
+# import required modules
+import random
+import string
+import threading
+import time
+
+
+#### Offline stand-in for the YouTube Data API ####
+
+# quota cost of each method, as documented by the YouTube Data API
+QUOTA_COSTS = {
+    ("search", "list"): 100,
+    ("videos", "list"): 1,
+    ("commentThreads", "list"): 1,
+}
+
+
+class MockResponse:
+    '''
+    HTTP response attached to MockHttpError, mimics httplib2.Response.
+    '''
+
+    def __init__(self, status):
+        self.status = status
+
+
+class MockHttpError(Exception):
+    '''
+    Error raised by the mock, mimics googleapiclient.errors.HttpError (status in resp.status, reason in the message).
+    '''
+
+    def __init__(self, status, reason):
+        super().__init__("<HttpError %d: %s>" % (status, reason))
+        self.resp = MockResponse(status)
+
+
+class MockRequest:
+    '''
+    Request object returned by the mock resources, mimics googleapiclient.http.HttpRequest.
+    '''
+
+    def __init__(self, service, resource, method, handler, kwargs):
+        self.service = service
+        self.resource = resource
+        self.method = method
+        self.handler = handler
+        self.kwargs = kwargs
+
+    def execute(self):
+        # simulate the network round trip
+        if self.service.latency > 0:
+            time.sleep(self.service.latency)
+        with self.service.lock:
+            self.service.n_requests += 1
+            self.service.quota_used += QUOTA_COSTS.get((self.resource, self.method), 1)
+            transient_error = self.service.rng.random() < self.service.error_rate
+        if transient_error:
+            raise MockHttpError(503, "backendError")
+        return self.handler(**self.kwargs)
+
+
+class MockResource:
+    '''
+    Resource object returned by the mock service (e.g. service.videos()).
+    '''
+
+    def __init__(self, service, resource):
+        self.service = service
+        self.resource = resource
+
+    def list(self, **kwargs):
+        handler = getattr(self.service, "_" + self.resource + "_list")
+        return MockRequest(self.service, self.resource, "list", handler, kwargs)
+
+
+class MockYouTubeService:
+    '''
+    Local mock of the discovery service object returned by utils.youtube_authenticate.
+
+    Each call to execute() sleeps for `latency` seconds and counts requests and quota units, so that
+    collection code can be benchmarked offline.
+
+    Args:
+    n_videos (int): number of synthetic videos known to the mock
+    latency (float): simulated round-trip time of each request, in seconds
+    missing_rate (float): fraction of videos for which videos().list returns no item (deleted or private videos)
+    max_comments (int): maximum number of comment threads per video
+    error_rate (float): probability that a request fails with a transient 503 error
+    seed (int): random seed for the synthetic data
+    '''
+
+    def __init__(self, n_videos=1000, latency=0.05, missing_rate=0.0, max_comments=100, error_rate=0.0, seed=42):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.n_requests = 0
+        self.quota_used = 0
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+
+        rng = random.Random(seed)
+        self.video_ids = ["".join(rng.choices(string.ascii_letters + string.digits + "-_", k=11)) for _ in range(n_videos)]
+        self.missing_ids = set(rng.sample(self.video_ids, int(n_videos * missing_rate)))
+        self.videos_data = {}
+        for i, video_id in enumerate(self.video_ids):
+            self.videos_data[video_id] = {
+                "kind": "youtube#video",
+                "id": video_id,
+                "snippet": {
+                    "publishedAt": "2020-01-%02dT12:00:00Z" % (i % 28 + 1),
+                    "channelId": "UC" + video_id,
+                    "title": "Video %d" % i,
+                    "description": "Description of video %d #veganuary" % i,
+                    "categoryId": "22",
+                },
+                "statistics": {
+                    "viewCount": str(rng.randint(0, 100000)),
+                    "likeCount": str(rng.randint(0, 1000)),
+                    "commentCount": str(rng.randint(0, 100)),
+                },
+            }
+        self.n_comments = {video_id: rng.randint(0, max_comments) for video_id in self.video_ids}
+        # a few videos have comments disabled
+        self.comments_disabled = set(rng.sample(self.video_ids, n_videos // 50))
+
+    def reset_counters(self):
+        self.n_requests = 0
+        self.quota_used = 0
+
+    def videos(self):
+        return MockResource(self, "videos")
+
+    def search(self):
+        return MockResource(self, "search")
+
+    def commentThreads(self):
+        return MockResource(self, "commentThreads")
+
+    def _videos_list(self, part, id, **kwargs):
+        ids = id.split(",")
+        if len(ids) > 50:
+            raise ValueError("videos().list accepts at most 50 ids")
+        items = [self.videos_data[video_id] for video_id in ids if video_id in self.videos_data and video_id not in self.missing_ids]
+        return {"kind": "youtube#videoListResponse", "items": items, "pageInfo": {"totalResults": len(items), "resultsPerPage": len(items)}}
+
+    def _search_list(self, part, maxResults=5, pageToken="", **kwargs):
+        start = int(pageToken) if pageToken else 0
+        end = min(start + maxResults, len(self.video_ids))
+        items = [{"kind": "youtube#searchResult", "id": {"kind": "youtube#video", "videoId": video_id}} for video_id in self.video_ids[start:end]]
+        results = {"kind": "youtube#searchListResponse", "items": items}
+        if end < len(self.video_ids):
+            results["nextPageToken"] = str(end)
+        return results
+
+    def _commentThreads_list(self, part, videoId, maxResults=20, pageToken="", **kwargs):
+        if videoId in self.comments_disabled:
+            raise MockHttpError(403, "commentsDisabled")
+        if videoId not in self.videos_data:
+            raise MockHttpError(404, "videoNotFound")
+        start = int(pageToken) if pageToken else 0
+        end = min(start + maxResults, self.n_comments[videoId])
+        items = []
+        for i in range(start, end):
+            comment_id = "%s.c%d" % (videoId, i)
+            items.append({
+                "kind": "youtube#commentThread",
+                "snippet": {
+                    "topLevelComment": {
+                        "id": comment_id,
+                        "snippet": {
+                            "textDisplay": "Comment %d on video %s, trying veganuary this year" % (i, videoId),
+                            "videoId": videoId,
+                            "likeCount": i % 7,
+                            "publishedAt": "2020-02-01T12:00:00Z",
+                        },
+                    },
+                    "totalReplyCount": 0,
+                },
+            })
+        results = {"kind": "youtube#commentThreadListResponse", "items": items}
+        if end < self.n_comments[videoId]:
+            results["nextPageToken"] = str(end)
+        return results
@@ -0,0 +1,121 @@
+import os
+import json
+import pandas as pd
+from cleaning_utils import CleanTextCache, CLEANING_SIGNATURE
+from store_utils import make_folder
+
+
+### Narrative catalog ###
+
+# narratives: agency-oriented (self) and communal-oriented (group), one file per cluster saved by clustering.ipynb
+IDENTITIES = ["self", "group"]
+NARRATIVE_PREFIX = "_mformer_wisescale_all_noscaled0_"
+
+def narrative_files(examples_dir="../data/examples"):
+    '''
+    Function to list the cluster files of the narratives, agency-oriented first.
+
+    Args:
+    examples_dir (str): folder with the cluster files
+
+    Returns:
+    list of (identity, cluster label, file name) tuples
+    '''
+    files = []
+    for identity in IDENTITIES:
+        for file in sorted(os.listdir(examples_dir)):
+            if file.startswith(identity + NARRATIVE_PREFIX) and file.endswith(".csv"):
+                # e.g. self_mformer_wisescale_all_noscaled0_cl_3.csv -> 3
+                cluster_label = file.split("_")[-1].split(".")[0]
+                files.append((identity, cluster_label, file))
+    return files
+
+
+def narratives_signature(examples_dir="../data/examples"):
+    '''
+    Returns the name, size and modification time of the cluster files and the hash of the cleaning code, to know
+    whether the catalog is up to date (transcripts are saved cleaned).
+    '''
+    files = {}
+    for _, _, file in narrative_files(examples_dir):
+        stat = os.stat(os.path.join(examples_dir, file))
+        files[file] = [stat.st_size, stat.st_mtime]
+    return {"Files": files, "Cleaning": CLEANING_SIGNATURE}
+
+
+def build_narratives(examples_dir="../data/examples", path="../data/narratives.pkl", clean_cache=None):
+    '''
+    Function to read the videos of all clusters once and save them in a single table, with one row per
+    (identity, cluster, video id): duplicate videos of a cluster are removed, transcripts are cleaned with clean_text
+    and videos with empty transcript are removed, as the analysis scripts did for each cluster file.
+
+    Args:
+    examples_dir (str): folder with the cluster files
+    path (str): path of the catalog (pickled dataframe)
+    clean_cache (CleanTextCache): cache of cleaned transcripts, default is the cache shared by the pipeline
+
+    Returns:
+    narratives (dataframe): columns "Identity" and "Cluster", then the columns of the cluster files
+    '''
+    clean_cache = clean_cache or CleanTextCache("../data/clean_text_cache.sqlite")
+    signature = narratives_signature(examples_dir)
+    make_folder(path)
+
+    clusters = []
+    for identity, cluster_label, file in narrative_files(examples_dir):
+        data_videos = pd.read_csv(os.path.join(examples_dir, file))
+        data_videos = data_videos.drop_duplicates(subset="Video ID")
+        data_videos.insert(0, "Identity", identity)
+        data_videos.insert(1, "Cluster", cluster_label)
+        clusters.append(data_videos)
+    narratives = pd.concat(clusters, ignore_index=True)
+
+    # transcripts of all clusters cleaned at once
+    narratives["Video Transcript"] = clean_cache.clean(narratives["Video Transcript"])
+    narratives = narratives[narratives["Video Transcript"] != ""].reset_index(drop=True)
+
+    # the signature is saved with the catalog, the file is replaced only when complete
+    narratives.to_pickle(path + ".tmp", compression=None)
+    os.replace(path + ".tmp", path)
+    with open(path + ".meta.json", "w") as f:
+        json.dump(signature, f)
+
+    print("Narratives: %d videos in %d clusters saved in %s" % (len(narratives), len(clusters), path))
+    return narratives
+
+
+def load_narratives(examples_dir="../data/examples", path="../data/narratives.pkl", clean_cache=None):
+    '''
+    Function to read the catalog of narratives, building it first if it is missing, older than the cluster files or
+    cleaned with another version of the cleaning code.
+
+    Args:
+    examples_dir (str): folder with the cluster files
+    path (str): path of the catalog (pickled dataframe)
+    clean_cache (CleanTextCache): cache of cleaned transcripts, used if the catalog has to be built
+
+    Returns:
+    narratives (dataframe): one row per (identity, cluster, video id), clusters in the order of narrative_files
+    '''
+    if os.path.exists(path) and os.path.exists(path + ".meta.json"):
+        with open(path + ".meta.json", "r") as f:
+            if json.load(f) == narratives_signature(examples_dir):
+                return pd.read_pickle(path)
+    return build_narratives(examples_dir, path, clean_cache)
+
+
+def iter_clusters(narratives, identity=None):
+    '''
+    Function to iterate over the clusters of the catalog, in the order of narrative_files.
+
+    Args:
+    narratives (dataframe): catalog returned by load_narratives
+    identity (str): "self" or "group" to keep only the clusters of that identity, default is all clusters
+
+    Returns:
+    generator of (identity, cluster label, videos of the cluster) tuples, videos with index 0 to n-1
+    '''
+    if identity is not None:
+        narratives = narratives[narratives["Identity"] == identity]
+    for (identity, cluster_label), data_videos in narratives.groupby(["Identity", "Cluster"], sort=False):
+        yield identity, cluster_label, data_videos.reset_index(drop=True)
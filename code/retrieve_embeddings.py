@@ -1,139 +1,61 @@
 # import packages
-import pandas as pd
-import pickle
-from sentence_transformers import SentenceTransformer
 import os
-import json
-from utils import clean_text, clean_comments
+from cleaning_utils import update_clean_comments, read_clean_comments, CleanTextCache
+from embedding_utils import encode, detect_device, EncoderPool, EmbeddingStore, MODEL_NAME
+from narrative_utils import load_narratives
 
-#### Suffix definition: type of embeddings to be extracted ####
+#### Type of embeddings to be extracted ####
 analyze_comments = False
 normalize_emb = False 
-
-if analyze_comments:
-    suffix = "withtrans_comments"
-elif not analyze_comments:
-    suffix = "withtrans"
+# comments are encoded in chunks, each saved as soon as it is encoded (an interrupted run resumes after the last saved chunk)
+chunk_size = 10000
+# without GPU, encode with a pool of processes (one model per process, each pinned to its own cores), 1 to use a single model
+n_encode_workers = max(1, (os.cpu_count() or 1) // 4)
+# int8 model on CPU: faster, embeddings slightly different (see benchmark_embeddings.py), saved in a separate store
+quantize = False
+
+# embeddings of videos and comments are kept in a store keyed by the text, one store per model and normalization:
+# texts already encoded (in another narrative, challenge or run) are not encoded again
+store = EmbeddingStore("./embedding_data/store_"+MODEL_NAME+("_norm" if normalize_emb else "")+("_int8" if quantize else ""))
+
+if detect_device() == "cpu" and (n_encode_workers > 1 or quantize):
+    encode_function = EncoderPool(n_encode_workers, normalize=normalize_emb, quantize=quantize)
 else:
-    suffix = "notrans"
-
-if normalize_emb:
-    suffix = suffix + "_norm"
+    encode_function = lambda texts: encode(texts, normalize=normalize_emb, show_progress_bar=False)
 
-if not os.path.exists("./embedding_data"):
-    os.makedirs("./embedding_data")
+# cleaned transcripts, shared by all scripts (each transcript is cleaned once)
+clean_cache = CleanTextCache("../data/clean_text_cache.sqlite")
 
 #### Functions definition ####
     
-def get_embeddings(data, type):
+def encode_new(sentences):
     '''
-    Function to get embeddings for a list of texts.
-
-    Args:
-    data (list): list of texts
-    type (str): type of data. Either "video" or "comment"
-
-    Returns:
-    embeddings (list): list of embeddings
+    Function to encode the sentences not in the store, on GPU if available, otherwise with the CPU encoding pool.
     '''
-
-    sentences = []
-    model = SentenceTransformer('all-MiniLM-L6-v2', device="cuda") # good performance, fast according to https://www.sbert.net/docs/pretrained_models.html
-
-    for i in range(len(data)):
-        if type == "video":
-            video_id = data.iloc[i]["Video ID"]
-            sentences.append([clean_text(data["Video Transcript"].values[i]), video_id])
-
-        else:
-            video_id = data.iloc[i]["VideoID"]
-            sentences.append([[clean_comments(item[1]), video_id] for item in data.iloc[i]["Comments"]])
-    
-    if type == "video":
-        # remove if text is empty
-        sentences = [item for item in sentences if item[0] != ""]
-
-        # get only sentences
-        sentences = [item[0] for item in sentences]
-
-        if normalize_emb:
-            embeddings = model.encode(sentences, show_progress_bar=True, normalize_embeddings=True)        
-        else:
-            embeddings = model.encode(sentences, show_progress_bar=True)
-    else:
-        sentences_all = [item for sublist in sentences for item in sublist]
-        # remove elements with empty text
-        sentences_all = [item for item in sentences_all if item[0] != ""]
-        sentences = list(dict.fromkeys([tuple(item) for item in sentences_all]))
-
-        # get only sentences
-        sentences = [item[0] for item in sentences]
-        print("length of texts:", len(sentences), flush=True)
-
-        if normalize_emb:
-            embeddings = model.encode(sentences, show_progress_bar=True, normalize_embeddings=True)
-        else:
-            embeddings = model.encode(sentences, show_progress_bar=True)
-
-    return embeddings
+    store.add_missing(sentences, encode_function)
     
 #### Retrieve embeddings ####
 
 if not analyze_comments:
     ### video content
 
-    # retrieve narratives
-    for file in os.listdir("../data/examples"):
-
-        # agency-oriented
-        if (file.startswith("self_mformer_wisescale_all_noscaled0")) and (".csv" in file):
-            identity = "self"
-            # focus on 1 narrative at a time
-            cluster_label = file.split("_")[-1].split(".")[0]
-            # read file as dataframe
-            data = pd.read_csv("../data/examples/" + file)
-
-            data = data.drop_duplicates(subset="Video ID")
-
-            embeddings = get_embeddings(data, "video")
-            with open("./embedding_data/embeddings_"+identity+"_"+suffix+"_cl_"+cluster_label+".pkl", "wb") as f:
-                pickle.dump(embeddings, f)
-        
-        # communal-oriented
-        if (file.startswith("group_mformer_wisescale_all_noscaled0")) and (".csv" in file):
-            identity = "group"
-            # focus on 1 narrative at a time
-            cluster_label = file.split("_")[-1].split(".")[0]
-            # read file as dataframe
-            data = pd.read_csv("../data/examples/" + file)
+    # narratives: agency-oriented (self) and communal-oriented (group), videos with empty transcript already removed
+    narratives = load_narratives("../data/examples", "../data/narratives.pkl", clean_cache)
+    sentences = list(narratives["Video Transcript"])
 
-            data = data.drop_duplicates(subset="Video ID")
-            
-            embeddings = get_embeddings(data, "video")
-
-            # save embeddings
-            with open("./embedding_data/embeddings_"+identity+"_"+suffix+"_cl_"+cluster_label+".pkl", "wb") as f:
-                pickle.dump(embeddings, f)
+    # encode the new transcripts of all narratives in a single pass
+    encode_new(sentences)
                 
 else:
     ### comments
 
-    # open all comments files in data/comments
-    data = []
-    for file in os.listdir("../data/comments/"):
-        if file.endswith(".json"):
-            with open("../data/comments/"+file, "r") as f:
-                data.append(json.load(f))
-
-    data = [item for sublist in data for item in sublist] 
-
-    # as dataframe
-    data = pd.DataFrame(data)
-    
-    embeddings = get_embeddings(data, "comment")
-
-    # save embeddings
-    with open("./embedding_data/embeddings_"+suffix+".pkl", "wb") as f:
-        pickle.dump(embeddings, f)
+    # cleaned comments, read one at a time from disk
+    update_clean_comments("../data/comments/", "../data/comments_clean.jsonl")
+    sentences = (item[0] for item in read_clean_comments("../data/comments_clean.jsonl"))
+    store.add_streaming(sentences, encode_function, chunk_size=chunk_size)
 
+if isinstance(encode_function, EncoderPool):
+    encode_function.close()
 
+print("Embedding store:", len(store), "texts")
+print("Clean text cache:", clean_cache.stats())
@@ -0,0 +1,264 @@
+import os
+import json
+import threading
+
+
+### Append-only JSON lines files ###
+
+def scan_jsonl(path):
+    '''
+    Function to read an append-only JSON lines file, removing a possibly incomplete last line left by a crash.
+    An invalid line followed by other lines is not a crash, and raises ValueError (nothing is removed).
+
+    Args:
+    path (str): path of the .jsonl file
+
+    Returns:
+    generator of (offset, record) tuples, where offset is the position of the line in the file
+    '''
+    file_size = os.path.getsize(path)
+    valid_size = 0
+    with open(path, "rb") as f:
+        for line in f:
+            valid = line.endswith(b"\n")
+            try:
+                record = json.loads(line) if valid else None
+            except ValueError:
+                valid = False
+            if not valid:
+                if valid_size + len(line) < file_size:
+                    raise ValueError("Invalid record at offset %d of %s, followed by other records" % (valid_size, path))
+                break
+            yield valid_size, record
+            valid_size += len(line)
+    if valid_size < file_size:
+        print("Removing incomplete record at the end of", path)
+        with open(path, "r+b") as f:
+            f.truncate(valid_size)
+
+
+def append_jsonl(path, records, fsync=True):
+    '''
+    Function to append records to a JSON lines file with a single write.
+
+    Args:
+    path (str): path of the .jsonl file
+    records (list): list of JSON-serializable records
+    fsync (bool): if True, force the records to disk before returning
+
+    Returns:
+    offsets (list): position of each record in the file
+    '''
+    lines = [(json.dumps(record) + "\n").encode("utf-8") for record in records]
+    with open(path, "ab") as f:
+        offset = f.tell()
+        f.write(b"".join(lines))
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    offsets = []
+    for line in lines:
+        offsets.append(offset)
+        offset += len(line)
+    return offsets
+
+
+def make_folder(path):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+
+### Comment storage ###
+
+class CommentStore:
+    '''
+    Append-only store of retrieved comments, one JSON line per video: {"VideoID": ..., "Comments": [...]}.
+
+    The ids of the videos already stored are kept in memory, so checking whether a video has to be retrieved is O(1),
+    and each video is written once at the end of the file instead of rewriting the whole file.
+    A line left incomplete by a crash is removed when the store is opened.
+
+    Args:
+    path (str): path of the .jsonl file, e.g. "../data/comments/<tag>.jsonl"
+    fsync (bool): if True, force each record to disk before returning
+    '''
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.video_ids = set()
+        self.lock = threading.Lock()
+
+        make_folder(path)
+        if os.path.exists(path):
+            for _, record in scan_jsonl(path):
+                self.video_ids.add(record["VideoID"])
+
+        # import comments saved by earlier versions of get_yt_comments.py
+        legacy_path = os.path.splitext(path)[0] + ".json"
+        if os.path.exists(legacy_path):
+            self._import_json(legacy_path)
+
+    def _import_json(self, legacy_path):
+        with open(legacy_path, "r") as f:
+            legacy_data = json.load(f)
+        new_data = [d for d in legacy_data if d["VideoID"] not in self.video_ids]
+        if new_data:
+            print("Importing %d videos from %s" % (len(new_data), legacy_path))
+            self.extend(new_data)
+
+    def __contains__(self, video_id):
+        return video_id in self.video_ids
+
+    def __len__(self):
+        return len(self.video_ids)
+
+    def append(self, video_id, comments):
+        '''
+        Appends the comments of a video to the store, unless the video is already stored.
+        '''
+        self.extend([{'VideoID': video_id, 'Comments': comments}])
+
+    def extend(self, records):
+        '''
+        Appends several {"VideoID": ..., "Comments": [...]} records with a single write.
+        '''
+        with self.lock:
+            new_records = []
+            for record in records:
+                if record["VideoID"] in self.video_ids:
+                    continue
+                new_records.append(record)
+                self.video_ids.add(record["VideoID"])
+            if new_records:
+                append_jsonl(self.path, new_records, fsync=self.fsync)
+
+
+def read_comments(comments_dir="../data/comments/"):
+    '''
+    Function to iterate over the stored comments, one video at a time, without loading all files in memory.
+
+    Reads the .jsonl files written by CommentStore and, for tags that have not been converted yet, the .json files
+    written by earlier versions of get_yt_comments.py. Files are read in alphabetical order, so the order of the
+    comments is the same in all scripts.
+
+    Args:
+    comments_dir (str): folder with the comment files
+
+    Returns:
+    generator of (video_id, comments) tuples, where comments is the list of [id, text, parent, likes, published_at]
+    '''
+    files = sorted(os.listdir(comments_dir))
+    for file in files:
+        name, extension = os.path.splitext(file)
+
+        if extension == ".jsonl":
+            with open(os.path.join(comments_dir, file), "r") as f:
+                for line in f:
+                    # skip an incomplete last line
+                    if not line.endswith("\n"):
+                        break
+                    record = json.loads(line)
+                    yield record["VideoID"], record["Comments"]
+
+        elif extension == ".json" and name + ".jsonl" not in files:
+            with open(os.path.join(comments_dir, file), "r") as f:
+                data = json.load(f)
+            for record in data:
+                yield record["VideoID"], record["Comments"]
+
+
+### Video registry ###
+
+class VideoRegistry:
+    '''
+    Per-tag registry of the videos whose details have already been retrieved, shared by all keyword and year runs
+    of get_yt_videos.py. Each line holds the row of a video as saved in the retrieved_*_video pickles (without the
+    transcript, kept in TranscriptStore).
+
+    Only the position of each video in the file is kept in memory, rows are read back from disk when needed.
+
+    Args:
+    path (str): path of the .jsonl file, e.g. "./data/<tag>/video_registry.jsonl"
+    fsync (bool): if True, force each write to disk before returning
+    '''
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.offsets = {}
+        self.lock = threading.Lock()
+
+        make_folder(path)
+        if os.path.exists(path):
+            for offset, record in scan_jsonl(path):
+                self.offsets[record["Video ID"]] = offset
+
+    def __contains__(self, video_id):
+        return video_id in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_many(self, video_ids):
+        '''
+        Returns the registered rows of the given videos, in the same order.
+        '''
+        # nothing registered yet: the file is only created by the first add_many
+        if not video_ids or not os.path.exists(self.path):
+            return []
+        rows = []
+        with open(self.path, "rb") as f:
+            for video_id in video_ids:
+                f.seek(self.offsets[video_id])
+                rows.append(json.loads(f.readline()))
+        return rows
+
+    def add_many(self, rows):
+        '''
+        Registers the rows of new videos (dicts with a "Video ID" key), videos already registered are skipped.
+        '''
+        with self.lock:
+            new_rows = {}
+            for row in rows:
+                if row["Video ID"] not in self.offsets and row["Video ID"] not in new_rows:
+                    new_rows[row["Video ID"]] = row
+            new_rows = list(new_rows.values())
+            if not new_rows:
+                return
+            offsets = append_jsonl(self.path, new_rows, fsync=self.fsync)
+            for row, offset in zip(new_rows, offsets):
+                self.offsets[row["Video ID"]] = offset
+
+
+### Transcript storage ###
+
+class TranscriptStore(VideoRegistry):
+    '''
+    Per-tag store of the retrieved transcripts, one line per video: {"Video ID": ..., "Video Transcript": ..., "Error": ...}.
+
+    Videos without captions are stored with a None transcript and the name of the error, so that they are not
+    requested again (their transcript is left to the Whisper fallback).
+
+    Args:
+    path (str): path of the .jsonl file, e.g. "./data/<tag>/transcripts.jsonl"
+    fsync (bool): if True, force each write to disk before returning
+    '''
+
+    def add(self, video_id, transcript, error=None):
+        '''
+        Stores the transcript of a video, or the error that prevented its retrieval.
+        '''
+        self.add_many([{"Video ID": video_id, "Video Transcript": transcript, "Error": error}])
+
+    def get_transcripts(self, video_ids):
+        '''
+        Returns the stored transcript of each video (None if missing or not retrievable), in the same order.
+        '''
+        stored_ids = [video_id for video_id in video_ids if video_id in self]
+        # nothing stored yet for these videos (the file may not exist)
+        if not stored_ids:
+            return [None] * len(video_ids)
+        transcripts = {row["Video ID"]: row["Video Transcript"] for row in self.get_many(stored_ids)}
+        return [transcripts.get(video_id) for video_id in video_ids]
@@ -6,9 +6,9 @@ from nltk.corpus import stopwords
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
 import numpy as np
-from langdetect import detect
 from wordcloud import STOPWORDS
-from utils import clean_text
+from cleaning_utils import CleanTextCache
+from language_utils import LanguageCache, language_mask
 
 #### Define tag ####
 tag = "nomeatmay"
@@ -48,16 +48,10 @@ retrieved_videos = retrieved_videos[retrieved_videos["Video Transcript"].notnull
 retrieved_videos = retrieved_videos.reset_index(drop=True)
 
 # language filter on the transcript, after Whisper captions have been retrieved
-list_to_drop = []
-for i in range(len(retrieved_videos)):
-    try:
-        language = detect(retrieved_videos["Video Transcript"].values[i])
-        if language != "en":
-            list_to_drop.append(i)
-    except:
-        print(retrieved_videos["Video Transcript"].values[i])
-        print("Error in language detection")
-retrieved_videos = retrieved_videos.drop(list_to_drop)
+# (languages are cached per video and field, so transcripts are not checked again)
+language_cache = LanguageCache("../data/"+tag+"/languages.jsonl")
+keep = language_mask(retrieved_videos, ["Video Transcript"], language="en", cache=language_cache)
+retrieved_videos = retrieved_videos[keep]
 
 
 # expand list of stop words with custom-made list
@@ -65,8 +59,11 @@ STOPWORDS = stopwords.words('english')
 add_list = ["uh", "well", "oh", "ah", "hes", "gonna", "going", "got", "okay", "hi", "hello", "hey", "yall", "like", "really", "yeah", "um", "im", "ive", "id", "ill", "youre", "youve", "youll", "youd", "youd", "shes", "dont", "arent", "isnt", "wasnt", "werent", "wont", "wouldnt", "shouldnt", "couldnt", "cant", "didnt", "doesnt", "hadnt", "hasnt", "havent", "aint", "thats", "theres", "whats", "whos", "wheres", "whens", "whys", "hows", "couldve", "shouldve", "wouldve", "mightve", "mustve", "cantve", "didnt", "doesnt", "hadnt", "hasnt", "havent", "aint", "thats", "theres", "whats", "whos", "wheres", "whens", "whys", "hows", "couldve", "shouldve", "wouldve", "mightve", "mustve", "cantve", "theyre", "actually", "theyve", "weve"]
 STOPWORDS.extend(add_list)
 
+# cleaned transcripts, shared by all scripts (each transcript is cleaned once)
+clean_cache = CleanTextCache("../data/clean_text_cache.sqlite")
+
 # clean Video Transcript column
-retrieved_videos['Video Transcript Clean'] = retrieved_videos['Video Transcript'].apply(lambda x: clean_text(x, STOPWORDS, topic_model=True))
+retrieved_videos['Video Transcript Clean'] = clean_cache.clean(retrieved_videos['Video Transcript'], STOPWORDS, topic_model=True)
 retrieved_videos = retrieved_videos[retrieved_videos['Video Transcript Clean'] != ''].reset_index(drop=True)
 
 # remove words related to a certain POS tag
@@ -114,3 +111,5 @@ retrieved_videos['topic_of_reference_words'] = retrieved_videos['topic'].apply(l
 
 # save dataframe as pickle file
 retrieved_videos.to_pickle("../data/"+tag+"/retrieved_videos_all_topic.pickle")
+
+print("Clean text cache:", clean_cache.stats())
@@ -0,0 +1,77 @@
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from youtube_transcript_api import YouTubeTranscriptApi
+
+
+### Caption retrieval ###
+
+# errors meaning that the video has no usable captions: not retried, the video is sent to the Whisper fallback
+NO_CAPTION_ERRORS = {"TranscriptsDisabled", "NoTranscriptFound", "NoTranscriptAvailable", "VideoUnavailable", "InvalidVideoId"}
+
+def fetch_transcript(video_id, languages=("en",), max_retries=3, backoff=2.0):
+    '''
+    Function to retrieve the automatic captions of a video, retrying transient errors with exponential backoff.
+
+    Args:
+    video_id (str): YouTube video ID
+    languages (tuple): caption languages, in order of preference
+    max_retries (int): maximum number of retries for transient errors (e.g. TooManyRequests)
+    backoff (float): base waiting time in seconds, doubled at each retry
+
+    Returns:
+    text (str): captions joined with '.'
+    '''
+    for attempt in range(max_retries + 1):
+        try:
+            srt = YouTubeTranscriptApi.get_transcript(video_id, languages=languages)
+            return '.'.join(i['text'] for i in srt)
+        except Exception as e:
+            if type(e).__name__ in NO_CAPTION_ERRORS or attempt == max_retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+
+
+def get_transcripts(video_ids, store, n_workers=8, max_retries=3):
+    '''
+    Function to retrieve the captions of many videos with a pool of threads. Transcripts are cached in the store:
+    only videos not in the store are requested, and each result is saved as soon as it is retrieved.
+
+    Args:
+    video_ids (list): list of YouTube video IDs
+    store (TranscriptStore): per-tag transcript store
+    n_workers (int): number of threads
+    max_retries (int): maximum number of retries for transient errors
+
+    Returns:
+    list_transcripts (list): transcript of each video, None if not available
+    '''
+    todo = [video_id for video_id in dict.fromkeys(video_ids) if video_id not in store]
+
+    if todo:
+        n_retrieved = 0
+        n_failed = 0
+        n_retry = 0
+        start_time = time.time()
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(fetch_transcript, video_id, max_retries=max_retries): video_id for video_id in todo}
+            for future in as_completed(futures):
+                video_id = futures[future]
+                try:
+                    store.add(video_id, future.result())
+                    n_retrieved += 1
+                except Exception as e:
+                    if type(e).__name__ in NO_CAPTION_ERRORS:
+                        # no captions, recorded for the Whisper fallback
+                        store.add(video_id, None, error=type(e).__name__)
+                        n_failed += 1
+                    else:
+                        # transient error, not stored so that the next run tries again
+                        print("Error in transcript retrieval for", video_id, type(e).__name__)
+                        n_retry += 1
+
+        print("Transcripts: %d retrieved, %d not available, %d to retry in %.1f seconds"
+              % (n_retrieved, n_failed, n_retry, time.time() - start_time))
+
+    return store.get_transcripts(video_ids)
@@ -4,7 +4,17 @@ from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 import pickle
-import sys
+import time
+import random
+import threading
+import multiprocessing
+import json
+import hashlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from itertools import islice
+import numpy as np
+from scipy.sparse import csr_matrix
 
 
 ### Data Cleaning ###
@@ -99,13 +109,289 @@ def clean_comments(text):
     return output
 
 
+# precompiled patterns of the batch versions
+# (punctuation replaced by spaces and extra spaces removed is the same as joining the runs of word characters)
+BRACKETS_RE = re.compile(r'\[.*?\]')
+WORDS_RE = re.compile(r'\w+')
+# urls, then mentions in one pass: a mention directly followed by a url is left to the url, as when removed one after the other
+URLS_MENTIONS_RE = re.compile(r'http\S+|@(?!http\S)\S+')
+
+def clean_text_batch(texts, STOPWORDS=[], topic_model=False):
+    '''
+    Function to clean many texts, with the same output as clean_text applied to each text.
+
+    Args:
+    texts (iterable): texts, e.g. a list or a pandas Series
+    STOPWORDS (list): list of stopwords to remove, default is empty list
+    topic_model (bool): if True, also remove stopwords and numbers
+
+    Returns:
+    cleaned (list): cleaned texts, in the same order
+    '''
+    stopwords = frozenset(STOPWORDS)
+    min_unique = 10 if topic_model else 5
+    remove_brackets = BRACKETS_RE.sub
+    find_words = WORDS_RE.findall
+
+    cleaned = []
+    for text in texts:
+        # '.' is replaced by a space together with the other punctuation
+        words = find_words(remove_brackets('', text).lower())
+        if topic_model:
+            words = [word for word in words if word not in stopwords and not word.isdigit()]
+
+        # less than 3 words means less than 5 unique words
+        if len(set(words)) < min_unique:
+            cleaned.append('')
+            continue
+        output = ' '.join(words)
+        cleaned.append(output if any(map(str.isalpha, output)) else '')
+
+    return cleaned
+
+
+def clean_comments_batch(texts):
+    '''
+    Function to clean many comments, with the same output as clean_comments applied to each comment.
+
+    Args:
+    texts (iterable): comments, e.g. a list or a pandas Series
+
+    Returns:
+    cleaned (list): cleaned comments, in the same order
+    '''
+    remove_urls_mentions = URLS_MENTIONS_RE.sub
+
+    cleaned = []
+    for text in texts:
+        if type(text) == float or text is None:
+            cleaned.append("")
+            continue
+        # most comments have no url or mention
+        output = remove_urls_mentions('', text) if '@' in text or 'http' in text else text
+        cleaned.append(output if len(set(output.split())) >= 5 else "")
+
+    return cleaned
+
+
+
+### Lexicon matching ###
+
+class LexiconMatcher:
+    '''
+    Matcher of the words of a dictionary, built once per dictionary. Entries ending with "*" match all words starting
+    with the rest of the entry (e.g. "protest*"), the other entries match identical words, as when each word is compared
+    with every entry.
+
+    Exact entries are kept in a set and wildcard entries in a set of prefixes, looked up once per prefix length.
+    The result of each distinct word is cached, so matching a corpus costs one lookup per distinct word.
+
+    Args:
+    entries (list): dictionary entries, e.g. df_collective_action["word"].values
+    '''
+
+    def __init__(self, entries):
+        self.exact = frozenset(entry for entry in entries if not entry.endswith("*"))
+        self.prefixes = frozenset(entry[:-1] for entry in entries if entry.endswith("*"))
+        self.prefix_lengths = sorted(set(len(prefix) for prefix in self.prefixes))
+        self.matches = {}
+
+    def match(self, word):
+        '''
+        Returns True if the word matches an entry of the dictionary.
+        '''
+        result = self.matches.get(word)
+        if result is None:
+            result = word in self.exact or any(word[:n] in self.prefixes for n in self.prefix_lengths if n <= len(word))
+            self.matches[word] = result
+        return result
+
+    def count(self, words):
+        '''
+        Returns the number of words matching an entry of the dictionary.
+        '''
+        return sum(map(self.match, words))
+
+    def count_many(self, texts):
+        '''
+        Returns the number of matching words of each tokenized text, in the same order.
+        '''
+        return [self.count(words) for words in texts]
+
+
+# first-person pronouns, as in the collective identity index
+FIRST_PERSON_SINGULAR = ['i', 'me', 'my', 'mine', 'myself']
+FIRST_PERSON_PLURAL = ['we', 'us', 'our', 'ours', 'ourselves']
+
+PUNCTUATION_RE = re.compile(r'[^\w\s]')
+
+def tokenize(text):
+    '''
+    Function to tokenize a text for lexicon matching: punctuation removed, lowercased and split on spaces.
+
+    Args:
+    text (str): input text, texts that are not strings (e.g. NaN) have no tokens
+
+    Returns:
+    tokens (list): list of words
+    '''
+    if not isinstance(text, str):
+        return []
+    return PUNCTUATION_RE.sub('', text).lower().split()
+
+
+class LexiconScorer:
+    '''
+    Scorer of texts on several lexicons (LIWC-style categories) in a single pass: each text is tokenized once into a
+    sparse document-term matrix, and the counts of all categories are the product of this matrix with the
+    term-category matrix. Each distinct word is matched against the lexicons once, so adding a lexicon adds a column
+    to the term-category matrix, not a pass over the corpus.
+
+    Args:
+    lexicons (dict): category name -> dictionary entries (see LexiconMatcher), e.g. {"collective_action": [...], "i": FIRST_PERSON_SINGULAR}
+    tokenizer (function): function returning the lowercased words of a text, default is tokenize
+    '''
+
+    def __init__(self, lexicons, tokenizer=tokenize):
+        self.categories = list(lexicons)
+        self.tokenizer = tokenizer
+        self.matchers = [LexiconMatcher(entries) for entries in lexicons.values()]
+        self.vocabulary = {}
+        # term-category matrix, one row per word of the vocabulary
+        self.word_categories = np.zeros((0, len(self.categories)), dtype=np.float64)
+
+    def score(self, texts, chunk_size=100000):
+        '''
+        Function to count the words of each category in each text.
+
+        Args:
+        texts (iterable): texts, e.g. a list or a pandas Series
+        chunk_size (int): number of texts in each document-term matrix, to bound memory
+
+        Returns:
+        counts (np.ndarray): number of words of each category, one row per text and one column per category,
+        and lengths (np.ndarray): number of words of each text
+        '''
+        all_counts = []
+        all_lengths = []
+        chunk = []
+        for text in texts:
+            chunk.append(text)
+            if len(chunk) == chunk_size:
+                counts, lengths = self.score_chunk(chunk)
+                all_counts.append(counts)
+                all_lengths.append(lengths)
+                chunk = []
+        if chunk or not all_counts:
+            counts, lengths = self.score_chunk(chunk)
+            all_counts.append(counts)
+            all_lengths.append(lengths)
+
+        return np.concatenate(all_counts), np.concatenate(all_lengths)
+
+    def score_chunk(self, texts):
+        # sparse document-term matrix of the chunk, new words are added to the vocabulary
+        n_words = len(self.vocabulary)
+        word_id = self.vocabulary.setdefault
+        indices = []
+        indptr = [0]
+        for text in texts:
+            indices.extend(word_id(word, len(self.vocabulary)) for word in self.tokenizer(text))
+            indptr.append(len(indices))
+
+        # match the new words against all lexicons
+        new_words = list(islice(self.vocabulary, n_words, None))
+        if new_words:
+            rows = np.array([[matcher.match(word) for matcher in self.matchers] for word in new_words], dtype=np.float64)
+            self.word_categories = np.vstack([self.word_categories, rows.reshape(len(new_words), len(self.categories))])
+
+        document_term = csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(texts), len(self.vocabulary)))
+        counts = np.asarray(document_term @ self.word_categories).reshape(len(texts), len(self.categories))
+        return counts.astype(np.int64), np.diff(indptr)
+
+    def rfreq(self, texts):
+        '''
+        Function to compute the relative frequency of each category in each text (NaN for texts without words).
+
+        Returns:
+        rfreq (np.ndarray): counts divided by the number of words, one row per text and one column per category
+        '''
+        counts, lengths = self.score(texts)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return counts / np.where(lengths > 0, lengths, np.nan)[:, None]
+
+
+### Collective identity index ###
+
+def score_first_person(texts):
+    '''
+    Function to count the first-person singular and plural pronouns of each text (run in the processes of collective_identity_index).
+    '''
+    counts, _ = LexiconScorer({"singular": FIRST_PERSON_SINGULAR, "plural": FIRST_PERSON_PLURAL}).score(texts)
+    return counts
+
+
+def collective_identity_index(texts, n_workers=1, chunk_size=20000):
+    '''
+    Function to compute the collective identity (I/we) index of many texts:
+    0.5 + 0.5 * (singular - plural) / (singular + plural + 1), where singular and plural are the numbers of
+    first-person singular and plural pronouns. Texts are tokenized with tokenize.
+
+    Args:
+    texts (iterable): texts, e.g. a list or a pandas Series of cleaned transcripts
+    n_workers (int): number of processes, texts are split into chunks of chunk_size texts
+    chunk_size (int): number of texts per process task
+
+    Returns:
+    scores (np.ndarray): I/we score of each text (above 0.5 for more singular pronouns), and the number of
+    singular and plural pronouns of each text (np.ndarray)
+    '''
+    texts = list(texts)
+    chunks = [texts[i:i+chunk_size] for i in range(0, len(texts), chunk_size)]
+
+    # forked processes do not re-run the calling script, which is not always under a __main__ guard
+    if n_workers > 1 and len(chunks) > 1 and "fork" in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("fork")) as executor:
+            counts = list(executor.map(score_first_person, chunks))
+    else:
+        counts = [score_first_person(chunk) for chunk in chunks]
+    counts = np.concatenate(counts) if counts else np.zeros((0, 2), dtype=np.int64)
+
+    singular, plural = counts[:, 0], counts[:, 1]
+    scores = 0.5 + 0.5 * (singular - plural) / (singular + plural + 1)
+    return scores, singular, plural
+
+
+def ci_orientation(scores, communal_threshold=0.4, agency_threshold=0.6):
+    '''
+    Function to split texts by collective identity index: communal-oriented (score <= communal_threshold),
+    agency-oriented (score >= agency_threshold) or neutral.
+
+    Args:
+    scores (array): I/we scores returned by collective_identity_index
+    communal_threshold (float): maximum score of communal-oriented texts
+    agency_threshold (float): minimum score of agency-oriented texts
+
+    Returns:
+    orientation (np.ndarray): "communal", "agency" or "neutral" for each text
+    '''
+    scores = np.asarray(scores)
+    return np.where(scores <= communal_threshold, "communal", np.where(scores >= agency_threshold, "agency", "neutral"))
+
 ### YouTube API ###
 
 # Function to authorize API access using OAuth2
-def youtube_authenticate(SCOPES):
+def get_credentials(SCOPES):
+    '''
+    Function to load the saved YouTube API credentials, refreshing them or running the authorization flow if needed.
+
+    Args:
+    SCOPES (list): API scopes
+
+    Returns:
+    creds: credentials, shared by all the API clients of a run
+    '''
     os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
-    api_service_name = "youtube"
-    api_version = "v3"
     client_secrets_file = "./credentials.json"
     creds = None
     # the file token.pickle stores the user's access and refresh tokens, and is
@@ -124,16 +410,55 @@ def youtube_authenticate(SCOPES):
         with open("./token.pickle", "wb") as token:
             pickle.dump(creds, token)
 
-    return build(api_service_name, api_version, credentials=creds)
+    return creds
+
+
+def build_service(creds):
+    '''
+    Returns a new YouTube API client built from credentials (clients are not thread-safe, use one per thread).
+    '''
+    return build("youtube", "v3", credentials=creds)
+
+
+def youtube_authenticate(SCOPES):
+    return build_service(get_credentials(SCOPES))
+
+# quota cost of each API call, in units
+API_UNIT_COSTS = {
+    "search": 100,
+    "videos": 1,
+    "commentThreads": 1,
+}
+
+# Function to retrieve one page of search results
+def search_videos_page(service, page_token='', limiter=None, **kwargs):
+    '''
+    Returns one page of videos based on keyword search parameters.
+
+    Args:
+        service: the YouTube API service object already initialized
+        page_token: token of the page to retrieve, empty string for the first page
+        limiter: RateLimiter counting the API units used, default is no limit
+        **kwargs: keyword arguments to be passed to service.search().list()
+
+    Returns:
+        a list of dicts representing each video and the token of the next page (None if this is the last page).
+    '''
+    if page_token:
+        kwargs['pageToken'] = page_token
+    search_results = execute_request(service.search().list(**kwargs), limiter=limiter, cost=API_UNIT_COSTS["search"])
+    return search_results.get('items', []), search_results.get('nextPageToken')
 
 # Function to search for videos based on a keyword
-def search_videos(service, threshold_api_units, n_nextpage=3, **kwargs):
+def search_videos(service, threshold_api_units, n_nextpage=3, limiter=None, **kwargs):
     '''
     Returns a list of videos based on keyword search parameters.
 
     Args:
         service: the YouTube API service object already initialized
         threshold_api_units: the maximum number of API units we can use in this query
+        n_nextpage: the maximum number of pages retrieved after the first one
+        limiter: RateLimiter counting the API units used, default is no limit
         **kwargs: keyword arguments to be passed to service.search().list()
 
     Returns:
@@ -146,31 +471,20 @@ def search_videos(service, threshold_api_units, n_nextpage=3, **kwargs):
 
     count_nextpage = 0
 
-    while total_api_units_used < threshold_api_units and next_page_token is not None and count_nextpage<=n_nextpage:
-        # Calculate the number of API units needed for the upcoming request (e.g., 100 units for search)
-        api_units_needed = 100
-
+    while count_nextpage <= n_nextpage:
         # Check if making the next request would exceed the threshold
-        if total_api_units_used + api_units_needed <= threshold_api_units:
-    
-            search_results = service.search().list(**kwargs).execute()
-            all_results.extend(search_results.get('items', []))
+        if total_api_units_used + API_UNIT_COSTS["search"] > threshold_api_units:
+            print("Reached API unit threshold. Stopping requests.")
+            break
 
-            total_api_units_used += api_units_needed
+        items, next_page_token = search_videos_page(service, page_token=next_page_token, limiter=limiter, **kwargs)
+        all_results.extend(items)
 
-            if total_api_units_used + api_units_needed <= threshold_api_units:
-            # Check for more pages of results
-                next_page_token = search_results.get('nextPageToken')
-                total_api_units_used += api_units_needed
-                print("Total units used: %d" % total_api_units_used)
-                if not next_page_token:
-                    break
-                kwargs['pageToken'] = next_page_token
-            else:
-                print("Reached API unit threshold. Stopping requests.")
-                break
-        else:
-            print("Reached API unit threshold. Stopping requests.")
+        total_api_units_used += API_UNIT_COSTS["search"]
+        print("Total units used: %d" % total_api_units_used)
+
+        # Check for more pages of results
+        if not next_page_token:
             break
 
         count_nextpage+=1
@@ -192,15 +506,191 @@ def get_video_details(service, video_id):
     video_details = service.videos().list(part='snippet,statistics', id=video_id).execute()
     return video_details.get('items', [])[0] if video_details.get('items', []) else None
 
+# Function to retrieve video details in batches
+def get_videos_details(service, video_ids, batch_size=50, limiter=None):
+    '''
+    Returns the detailed description of several videos, fetched with one videos().list call per batch of ids.
+
+    Args:
+        service: the YouTube API service object already initialized
+        video_ids: list of IDs of the videos for which we want to retrieve details
+        batch_size: number of ids per request, the API accepts at most 50
+        limiter: RateLimiter counting the API units used, default is no limit
+
+    Returns:
+        a list of dicts representing video details, in the same order as video_ids (None if the video was not returned),
+        and the list of ids for which no details were returned.
+    '''
+    batch_size = min(batch_size, 50)
+
+    # request each id only once, keeping the order of first appearance
+    unique_ids = list(dict.fromkeys(video_ids))
+
+    details_by_id = {}
+    for start in range(0, len(unique_ids), batch_size):
+        batch = unique_ids[start:start+batch_size]
+        video_details = execute_request(service.videos().list(part='snippet,statistics', id=','.join(batch)), limiter=limiter, cost=API_UNIT_COSTS["videos"])
+        for item in video_details.get('items', []):
+            details_by_id[item['id']] = item
+
+    # merge back in input order
+    details = [details_by_id.get(video_id) for video_id in video_ids]
+    missing_ids = [video_id for video_id in unique_ids if video_id not in details_by_id]
+
+    return details, missing_ids
+
+
+### Rate limiting and retries ###
+
+class QuotaExceededError(Exception):
+    '''
+    Raised when the daily API quota is exhausted.
+    '''
+    pass
+
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket.
+
+    Args:
+    rate (float): number of tokens added to the bucket per second
+    capacity (float): maximum number of tokens in the bucket
+    tokens (float): initial number of tokens, default is a full bucket
+    '''
+
+    def __init__(self, rate, capacity, tokens=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity if tokens is None else tokens
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+
+    def try_acquire(self, tokens=1):
+        '''
+        Takes tokens from the bucket if available, without waiting. Returns True if the tokens were taken.
+        '''
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        '''
+        Takes tokens from the bucket, waiting until they are available.
+        '''
+        if tokens > self.capacity:
+            raise ValueError("Cannot acquire more tokens than the bucket capacity")
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    '''
+    Limiter shared by all threads using the API: caps requests per second and API units per day.
+
+    Args:
+    requests_per_second (float): maximum request rate
+    daily_quota (int): API units available per day (10000 is the default YouTube Data API quota)
+    quota_used (int): API units already used today
+    '''
+
+    def __init__(self, requests_per_second=10, daily_quota=10000, quota_used=0):
+        self.requests = TokenBucket(requests_per_second, max(1, requests_per_second))
+        # the quota refills continuously over 24 hours
+        self.quota = TokenBucket(daily_quota / 86400, daily_quota, tokens=daily_quota - quota_used)
+        self.units_used = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        '''
+        Waits for a request slot and takes `cost` API units. Raises QuotaExceededError if the quota is exhausted.
+        '''
+        if not self.quota.try_acquire(cost):
+            raise QuotaExceededError("Daily quota exhausted after %d units" % self.units_used)
+        with self.lock:
+            self.units_used += cost
+        self.requests.acquire(1)
+
+
+# HTTP status codes worth retrying
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+def is_retryable_error(error):
+    '''
+    Function to check whether an API error is transient.
+
+    Args:
+    error (Exception): exception raised by request.execute()
+
+    Returns:
+    True if the request should be retried, False otherwise
+    '''
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is None:
+        # network errors (timeouts, connection resets)
+        return isinstance(error, OSError)
+    if int(status) == 403:
+        return 'rateLimitExceeded' in str(error)
+    return int(status) in RETRYABLE_STATUS
+
+
+def execute_request(request, limiter=None, cost=1, max_retries=5, backoff=1.0):
+    '''
+    Function to execute an API request, retrying transient errors with exponential backoff.
+
+    Args:
+    request: request object returned by the service (e.g. service.videos().list(...))
+    limiter (RateLimiter): limiter shared across threads, default is no limit
+    cost (int): API units used by the request
+    max_retries (int): maximum number of retries
+    backoff (float): base waiting time in seconds, doubled at each retry
+
+    Returns:
+    response (dict): the API response
+    '''
+    # responses served from the cache do not use the API
+    if isinstance(request, CachedRequest) and request.lookup() is not None:
+        return request.execute()
+
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire(cost)
+        try:
+            return request.execute()
+        except Exception as e:
+            if 'quotaExceeded' in str(e):
+                raise QuotaExceededError(str(e)) from e
+            if attempt == max_retries or not is_retryable_error(e):
+                raise
+            # exponential backoff with jitter
+            time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+
 
 # Function to retrieve comments from a video
-def get_video_comments(service, video_id, **kwargs):
+def get_video_comments(service, video_id, limiter=None, max_retries=5, backoff=1.0, **kwargs):
     '''
     Function to retrieve comments from a video.
 
     Args:
     service (googleapiclient.discovery.Resource): authenticated YouTube API service instance
     video_id (str): YouTube video ID
+    limiter (RateLimiter): limiter shared across threads, default is no limit
+    max_retries (int): maximum number of retries for transient errors
+    backoff (float): base waiting time in seconds between retries
     kwargs: arguments to be passed to comments().list()
 
     Returns:
@@ -210,10 +700,15 @@ def get_video_comments(service, video_id, **kwargs):
     comments = []
 
     try:
-        results = service.commentThreads().list(videoId=video_id, part='snippet,replies', **kwargs).execute()
-    except:
-        print("Error with video:", video_id, sys.exc_info()[0])
-        return comments
+        results = execute_request(service.commentThreads().list(videoId=video_id, part='snippet,replies', **kwargs), limiter=limiter, cost=API_UNIT_COSTS["commentThreads"], max_retries=max_retries, backoff=backoff)
+    except QuotaExceededError:
+        raise
+    except Exception as e:
+        # comments disabled or video removed, nothing to retrieve
+        if 'commentsDisabled' in str(e) or 'videoNotFound' in str(e):
+            print("No comments for video:", video_id)
+            return comments
+        raise
 
     n_comments = 0
     while results:
@@ -251,12 +746,297 @@ def get_video_comments(service, video_id, **kwargs):
         # Check for more pages of comments
         if 'nextPageToken' in results:
             kwargs['pageToken'] = results['nextPageToken']
-            try:
-                results = service.commentThreads().list(videoId=video_id, part='snippet,replies', **kwargs).execute()
-            except:
-                print("Error with video:", video_id, sys.exc_info()[0])
-                return comments
+            results = execute_request(service.commentThreads().list(videoId=video_id, part='snippet,replies', **kwargs), limiter=limiter, cost=API_UNIT_COSTS["commentThreads"], max_retries=max_retries, backoff=backoff)
         else:
             break
 
-    return comments
\ No newline at end of file
+    return comments
+
+
+# Function to retrieve comments from many videos in parallel
+def harvest_comments(video_ids, service_factory, n_workers=8, limiter=None, max_retries=5, backoff=1.0, on_result=None, **kwargs):
+    '''
+    Function to retrieve comments from many videos with a pool of threads, each with its own API client.
+
+    Args:
+    video_ids (list): list of YouTube video IDs
+    service_factory (callable): function returning a new YouTube API service instance, called once per thread
+    n_workers (int): number of threads
+    limiter (RateLimiter): limiter shared across threads, default is no limit
+    max_retries (int): maximum number of retries for transient errors
+    backoff (float): base waiting time in seconds between retries
+    on_result (callable): function called in the main thread as on_result(video_id, comments) for each retrieved video
+    kwargs: arguments to be passed to comments().list()
+
+    Returns:
+    stats (dict): number of retrieved and failed videos, failed video IDs with their error, whether the quota was exhausted,
+    elapsed time and throughput in videos per minute
+    '''
+
+    # API clients are not thread-safe, keep one per thread
+    local = threading.local()
+    stop = threading.Event()
+
+    def fetch(video_id):
+        if stop.is_set():
+            return None
+        if not hasattr(local, "service"):
+            local.service = service_factory()
+        return get_video_comments(local.service, video_id, limiter=limiter, max_retries=max_retries, backoff=backoff, **kwargs)
+
+    n_done = 0
+    failed = []
+    quota_exceeded = False
+    start_time = time.time()
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(fetch, video_id): video_id for video_id in video_ids}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            video_id = futures[future]
+            try:
+                comments = future.result()
+            except QuotaExceededError as e:
+                if not quota_exceeded:
+                    print("Quota exhausted, stopping:", e)
+                quota_exceeded = True
+                stop.set()
+                for pending in futures:
+                    pending.cancel()
+                continue
+            except Exception as e:
+                print("Error with video:", video_id, repr(e))
+                failed.append((video_id, repr(e)))
+                continue
+
+            # videos skipped after the quota was exhausted
+            if comments is None:
+                continue
+
+            n_done += 1
+            if on_result is not None:
+                on_result(video_id, comments)
+
+            if n_done % 10 == 0:
+                elapsed = time.time() - start_time
+                print("N. videos:", n_done, "/", len(video_ids), "- %.1f videos/min" % (60 * n_done / elapsed))
+
+    elapsed = time.time() - start_time
+    stats = {
+        "n_videos": n_done,
+        "n_failed": len(failed),
+        "failed": failed,
+        "quota_exceeded": quota_exceeded,
+        "elapsed": elapsed,
+        "videos_per_minute": 60 * n_done / elapsed if elapsed > 0 else 0.0,
+    }
+    print("Retrieved %d videos (%d failed) in %.1f seconds, %.1f videos/min" % (n_done, len(failed), elapsed, stats["videos_per_minute"]))
+
+    return stats
+
+
+### Response cache ###
+
+class CacheMissError(KeyError):
+    '''
+    Raised in replay-only mode when a response is not in the cache.
+    '''
+    pass
+
+
+class CachedApiError(Exception):
+    '''
+    Raised when the cache holds a permanent API error for a request (e.g. comments disabled).
+    '''
+    pass
+
+
+# API errors that do not change when the request is repeated, cached like responses
+PERMANENT_ERRORS = ("commentsDisabled", "videoNotFound")
+
+
+# time to live of cached responses per resource, in seconds (None = never expires)
+# video statistics and search results change quickly, comment pages mostly do not
+DEFAULT_TTL = {
+    "search": 24 * 3600,
+    "videos": 24 * 3600,
+    "commentThreads": 30 * 24 * 3600,
+}
+
+class ResponseCache:
+    '''
+    On-disk cache of YouTube API responses, stored in a SQLite file and shared by all threads.
+
+    Args:
+    path (str): path of the SQLite file
+    ttl (dict): time to live in seconds per resource (e.g. {"videos": 86400}), resources not listed never expire
+    max_size (int): maximum total size of the cached responses in bytes, least recently used entries are evicted first
+    replay_only (bool): if True, never call the API: serve cached responses even if expired and raise CacheMissError otherwise
+    '''
+
+    def __init__(self, path="./api_cache.sqlite", ttl=None, max_size=2 * 1024 ** 3, replay_only=False):
+        self.path = path
+        self.ttl = DEFAULT_TTL if ttl is None else ttl
+        self.max_size = max_size
+        self.replay_only = replay_only
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, resource TEXT, created REAL, accessed REAL, size INTEGER, response TEXT)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.connection.commit()
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(resource, method, kwargs):
+        '''
+        Function to build the cache key of a request from the resource, the method and the normalized arguments.
+        '''
+        normalized = {}
+        for name, value in kwargs.items():
+            if value is None:
+                continue
+            value = str(value)
+            # the order of the requested parts does not change the response
+            if name == "part":
+                value = ",".join(sorted(p.strip() for p in value.split(",")))
+            normalized[name] = value
+        key = json.dumps([resource, method, normalized], sort_keys=True)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, key, resource):
+        '''
+        Returns the cached response, or None if it is missing or expired.
+        '''
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT created, response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            created, response = row
+            ttl = self.ttl.get(resource)
+            if not self.replay_only and ttl is not None and now - created > ttl:
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.hits += 1
+        return json.loads(response)
+
+    def put(self, key, resource, response):
+        '''
+        Stores a response, evicting the least recently used entries if the cache is full.
+        '''
+        now = time.time()
+        data = json.dumps(response)
+        size = len(data)
+        with self.lock:
+            old = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self.size -= old[0]
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", (key, resource, now, now, size, data))
+            self.size += size
+
+            # evict least recently used entries
+            while self.size > self.max_size:
+                rows = self.connection.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 100").fetchall()
+                if not rows:
+                    break
+                for old_key, old_size in rows:
+                    self.connection.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    self.size -= old_size
+                    if self.size <= self.max_size:
+                        break
+            self.connection.commit()
+
+    def stats(self):
+        '''
+        Returns the number of cache hits and misses and the cache size in bytes.
+        '''
+        return {"hits": self.hits, "misses": self.misses, "size": self.size}
+
+
+class CachedRequest:
+    '''
+    Request returned by CachedService, executes the wrapped request only on a cache miss.
+    '''
+
+    def __init__(self, cache, service, resource, method, kwargs):
+        self.cache = cache
+        self.service = service
+        self.resource = resource
+        self.method = method
+        self.kwargs = kwargs
+        self.key = ResponseCache.make_key(resource, method, kwargs)
+        self.response = None
+        self.looked_up = False
+
+    def lookup(self):
+        '''
+        Returns the cached response, or None if the request has to be sent to the API.
+        '''
+        if not self.looked_up:
+            self.response = self.cache.get(self.key, self.resource)
+            self.looked_up = True
+        return self.response
+
+    def execute(self, **kwargs):
+        response = self.lookup()
+        if response is not None:
+            if "cachedError" in response:
+                raise CachedApiError(response["cachedError"])
+            return response
+        if self.cache.replay_only:
+            raise CacheMissError("%s().%s(%s) is not in the cache" % (self.resource, self.method, self.kwargs))
+        request = getattr(getattr(self.service, self.resource)(), self.method)(**self.kwargs)
+        try:
+            response = request.execute(**kwargs)
+        except Exception as e:
+            # only permanent errors are cached, transient errors are retried
+            if any(reason in str(e) for reason in PERMANENT_ERRORS):
+                self.cache.put(self.key, self.resource, {"cachedError": str(e)})
+            raise
+        self.cache.put(self.key, self.resource, response)
+        return response
+
+
+class CachedResource:
+    '''
+    Resource returned by CachedService (e.g. service.videos()).
+    '''
+
+    def __init__(self, cache, service, resource):
+        self.cache = cache
+        self.service = service
+        self.resource = resource
+
+    def __getattr__(self, method):
+        def build_request(**kwargs):
+            return CachedRequest(self.cache, self.service, self.resource, method, kwargs)
+        return build_request
+
+
+class CachedService:
+    '''
+    Transparent caching wrapper around the YouTube API service object: service.videos().list(...).execute()
+    returns the cached response when available and calls the API otherwise.
+
+    Args:
+    service: the YouTube API service object already initialized (can be None in replay-only mode)
+    cache (ResponseCache): response cache, can be shared by several services (e.g. one per thread)
+    '''
+
+    def __init__(self, service, cache):
+        self.service = service
+        self.cache = cache
+
+    def __getattr__(self, resource):
+        def build_resource():
+            return CachedResource(self.cache, self.service, resource)
+        return build_resource
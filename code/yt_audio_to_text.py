@@ -1,98 +1,71 @@
 # import required modules
-import whisper
-from langdetect import detect
-from pytube import YouTube
 import pickle
+from audio_utils import transcribe_videos
+from store_utils import TranscriptStore
+from language_utils import LanguageCache, language_mask
 
 #### Define tag ####
 tag = "nomeatmay"
 
-#### Whisper transcription ####
-
-# loop over years
-for YEAR in range(2014,2024):
-
-    # load the retrieved videos for the year
-    with open("../data/"+tag+"/retrieved_allvideos_"+str(YEAR)+".pickle", "rb") as token:    
-        retrieved_videos = pickle.load(token)
-
-    # language filter on the description of the videos in retrieved_videos with detect from langdetect
-    list_to_drop = []
-    for i in range(len(retrieved_videos)):
-        try:
-            language = detect(retrieved_videos["Video Description"].values[i])
-            if language != "en":
-                list_to_drop.append(i)
-        except:
-            try:
-                # if Video Description is None, check Video Title
-                language = detect(retrieved_videos["Video Title"].values[i])
-                if language != "en":
-                    list_to_drop.append(i)
-            except:
-                # if Video Title is None, print Video Description and Video ID
-                print(retrieved_videos["Video Description"].values[i])
-                print("Error in language detection")
-
-    retrieved_videos = retrieved_videos.drop(list_to_drop)
-
-    # check which values in the Video Transcript column are None and save the video ids in a list  
-    video_ids = []
-    for i in range(len(retrieved_videos)):
-        if retrieved_videos["Video Transcript"].values[i] == None:
-            video_ids.append(retrieved_videos["Video ID"].values[i])
-
-    # retrieve Whisper captions for the videos in video_ids
-    counter = 0
-    for id in video_ids:
-
-        # Create the URL for the YouTube video
-        url = "https://www.youtube.com/watch?v=" + id
-
-        # Create a YouTube object from the URL
-        try:
-            yt = YouTube(url)
-        except:
-            print("Error in video download")
-            # delete row corresponding to video ID from retrieved_videos
-            retrieved_videos = retrieved_videos[retrieved_videos["Video ID"] != id]
-            continue
-
-        # Check if the video is longer than 10 minutes
-        if yt.length > 600:
-            print("Video too long")
-            # delete row corresponding to video ID from retrieved_videos
-            retrieved_videos = retrieved_videos[retrieved_videos["Video ID"] != id]
-            continue
-        
-        # Get the audio stream
-        try:
-            audio_stream = yt.streams.filter(only_audio=True).first()
-            # Download the audio stream
-            output_path = "YoutubeAudios"
-            filename = "audio_"+id+".mp3"
-            audio_stream.download(output_path=output_path, filename=filename)
-
-            # Load the base model and transcribe the audio
-            model = whisper.load_model("base")
-            result = model.transcribe("./YoutubeAudios/audio_"+id+".mp3")
-
-            transcribed_text = result["text"]
-            retrieved_videos.loc[retrieved_videos["Video ID"] == id, "Video Transcript"] = transcribed_text
-            
-        except:
-            print("Error in audio download or transcription")
-            # delete row corresponding to video ID from retrieved_videos
-            retrieved_videos = retrieved_videos[retrieved_videos["Video ID"] != id]
-
-        counter += 1
-
-        if counter % 10 == 0:
-            print("Counter:", counter)
-
-    # reset index of retrieved_videos
-    retrieved_videos = retrieved_videos.reset_index(drop=True)
-
-    # save dataframe to pickle file
-    with open("../data/"+tag+"/retrieved_allvideos_"+str(YEAR)+".pickle", "wb") as token:    
-        pickle.dump(retrieved_videos, token)
\ No newline at end of file
+# audio downloads run in threads, transcriptions in processes (CPU only), the model is loaded once per process
+n_download_workers = 4
+n_transcribe_workers = 1
+
+# pre-processing: decode the audio once, trim silences and split long videos into chunks transcribed in parallel,
+# so that videos longer than 10 minutes can be included
+preprocess = False
+max_length = 3600 if preprocess else 600 # maximum video length in seconds
+chunk_length = 300 # maximum chunk length in seconds
+
+# number of processes for language detection
+n_language_workers = 4
+
+# transcription processes re-import this script on platforms that spawn processes (e.g. macOS)
+if __name__ == "__main__":
+
+    # Whisper transcripts of each video, so that videos are never transcribed twice
+    store = TranscriptStore("../data/"+tag+"/whisper_transcripts.jsonl")
+    # detected languages of each video, so that the filter is not run again
+    language_cache = LanguageCache("../data/"+tag+"/languages.jsonl")
+
+    #### Whisper transcription ####
+
+    # loop over years
+    for YEAR in range(2014,2024):
+
+        # load the retrieved videos for the year
+        with open("../data/"+tag+"/retrieved_allvideos_"+str(YEAR)+".pickle", "rb") as token:    
+            retrieved_videos = pickle.load(token)
+
+        # language filter on the description of the videos (or on the title, if the description is empty)
+        keep = language_mask(retrieved_videos, ["Video Description", "Video Title"], language="en", cache=language_cache, n_workers=n_language_workers)
+        retrieved_videos = retrieved_videos[keep]
+
+        # check which values in the Video Transcript column are None and save the video ids in a list  
+        video_ids = []
+        for i in range(len(retrieved_videos)):
+            if retrieved_videos["Video Transcript"].values[i] == None:
+                video_ids.append(retrieved_videos["Video ID"].values[i])
+
+        # retrieve Whisper captions for the videos in video_ids, transcripts are cached in the store
+        if video_ids:
+            transcribe_videos(video_ids, store, model_name="base", n_download_workers=n_download_workers, n_transcribe_workers=n_transcribe_workers, max_length=max_length, preprocess=preprocess, chunk_length=chunk_length)
+
+        whisper_transcripts = store.get_transcripts(video_ids)
+        for id, transcribed_text in zip(video_ids, whisper_transcripts):
+            if id not in store:
+                # transient download error: the row is kept without transcript, the next run tries again
+                continue
+            if transcribed_text is None:
+                # video unavailable or too long, no speech, or error in transcription
+                # delete row corresponding to video ID from retrieved_videos
+                retrieved_videos = retrieved_videos[retrieved_videos["Video ID"] != id]
+            else:
+                retrieved_videos.loc[retrieved_videos["Video ID"] == id, "Video Transcript"] = transcribed_text
+
+        # reset index of retrieved_videos
+        retrieved_videos = retrieved_videos.reset_index(drop=True)
+
+        # save dataframe to pickle file
+        with open("../data/"+tag+"/retrieved_allvideos_"+str(YEAR)+".pickle", "wb") as token:    
+            pickle.dump(retrieved_videos, token)